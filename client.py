@@ -2,24 +2,280 @@
 Maintains several connections to MCP servers.
 """
 
+import asyncio
 import json
+import logging
 import subprocess
 import threading
 import time
 import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait, TimeoutError as FutureTimeoutError
+from urllib.parse import urljoin
+
+import httpx
+
+import codec
+from ratelimit import limiter, is_quota_text, quota_retry_after
+
+
+def server_env(server_config):
+    """Environment for a spawned server: ours, plus the switches the manifest turns on for it."""
+    env = dict(os.environ)
+    if server_config.get("structured_content"):
+        # the bundled servers then return results as structuredContent instead of JSON text
+        env["MCP_STRUCTURED_CONTENT"] = "1"
+    if server_config.get("rate_limits"):
+        # limits for the Google API buckets inside the server, see ratelimit.py
+        env["AEGIS_RATE_LIMITS"] = codec.dumps(server_config["rate_limits"])
+    return env
+
+
+def is_quota_error(response):
+    """Whether a tools/call response is a tool error caused by a rate limit or quota upstream."""
+    result = response.get("result") if isinstance(response, dict) else None
+    if not isinstance(result, dict) or not result.get("isError"):
+        return False
+    return any(is_quota_text(str(block.get("text", ""))) for block in result.get("content", []))
+
+
+class StderrSink:
+    """
+    Level-aware, rate-limited destination for a server's stderr lines.
+
+    Each line is given a level from the keywords it contains. Lines below `level` are dropped,
+    lines below WARNING are limited to `rate_limit` per second (a token bucket with one second
+    of burst), and warnings and errors are always printed.
+    """
+
+    LEVEL_KEYWORDS = [
+        ("CRITICAL", logging.CRITICAL),
+        ("Traceback", logging.ERROR),
+        ("ERROR", logging.ERROR),
+        ("Error", logging.ERROR),
+        ("WARNING", logging.WARNING),
+        ("Warning", logging.WARNING),
+        ("DEBUG", logging.DEBUG),
+    ]
+
+    def __init__(self, pipe_name, level="INFO", rate_limit=20):
+        self.pipe_name = pipe_name
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.rate_limit = rate_limit
+        self.tokens = rate_limit
+        self.last_refill = time.monotonic()
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def classify(self, line):
+        for keyword, level in self.LEVEL_KEYWORDS:
+            if keyword in line:
+                return level
+        return logging.INFO
+
+    def write(self, line):
+        level = self.classify(line)
+        if level < self.level:
+            return
+
+        with self.lock:
+            if level < logging.WARNING and self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.last_refill) * self.rate_limit)
+                self.last_refill = now
+                if self.tokens < 1:
+                    self.suppressed += 1
+                    return
+                self.tokens -= 1
+
+            suppressed, self.suppressed = self.suppressed, 0
+
+        if suppressed:
+            print(f"{self.pipe_name}: ({suppressed} lines suppressed)")
+        print(f"{self.pipe_name}: {line}")
+
+class JSONRPCClient:
+    """
+    JSON-RPC bookkeeping shared by MCPClient and AsyncMCPClient: request ids and the futures
+    waiting on them, matching responses (batches included) to those futures, cancellation, and
+    the messages of the initialize handshake. Subclasses own the transport and the kind of future.
+    """
 
-class MCPClient:
     def __init__(self, server_name, server_config):
-        # (server_name: process)
         self.server_name = server_name
         self.server_config = server_config
 
         self.req_id = 1
+        self.req_lock = threading.Lock()
+        # (request id: future) for requests still waiting on a response
+        self.pending = {}
+        self.request_timeout = server_config.get("request_timeout", 60)
+        # tool name -> seconds, from the "timeout" of each tool in the manifest
+        self.tool_timeouts = {tool["name"]: tool["timeout"] for tool in server_config.get("tools", []) if "timeout" in tool}
+        # ids of the latest requests given up on, whose responses are dropped if they still arrive
+        self.cancelled = deque(maxlen=100)
+        # requests to this server go through the "mcp:<server>" bucket, configured by "rate_limit"
+        if "rate_limit" in server_config:
+            limiter.configure({f"mcp:{server_name}": server_config["rate_limit"]})
+        self.rate_limit = limiter.bucket(f"mcp:{server_name}")
+        # set while a batch probe waits for the server's answer, see MCPClient._probe_batch
+        self.batch_probe = None
+        self.startup_timeout = server_config.get("startup_timeout", 60)
+        self.startup_time = None
+        self.server_info = None
         self.process = None
+        # only messages nobody was waiting on (notifications, late responses) are kept, newest last
+        self.messages = deque(maxlen=server_config.get("message_buffer_size", 100))
+        self.stderr_logs = deque(maxlen=server_config.get("stderr_buffer_size", 500))
+        self.stderr_sink = StderrSink(
+            f"{server_name}-stderr",
+            level=server_config.get("stderr_level", "INFO"),
+            rate_limit=server_config.get("stderr_rate_limit", 20)
+        )
+
+    def _new_future(self):
+        raise NotImplementedError
+
+    def _register_request(self):
+        """Reserves the next JSON-RPC id and the future its response will complete."""
+        future = self._new_future()
+        with self.req_lock:
+            request_id = self.req_id
+            self.req_id += 1
+            self.pending[request_id] = future
+        return request_id, future
+
+    def _forget(self, request_id):
+        """Stops waiting on request_id; returns whether it was still pending."""
+        with self.req_lock:
+            return self.pending.pop(request_id, None) is not None
+
+    def _request_message(self, request_id, method, params):
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": method,
+            "params": params
+        }
+
+    def _initialize_message(self, request_id):
+        return self._request_message(request_id, "initialize", {
+            "protocolVersion": "2025-03-26",
+            "capabilities": {},
+            "clientInfo": {
+                "name": "aegis",
+                "version": "0.1.0"
+            }
+        })
+
+    def _accept_initialize(self, init_response):
+        """Records the server's answer to initialize; returns False if it rejected it."""
+        if "error" in init_response:
+            print(f"Server {self.server_name} rejected initialize: {init_response['error']}")
+            return False
+        self.server_info = init_response.get("result", {})
+        return True
+
+    def _initialized_message(self):
+        """The notification ending the handshake."""
+        message = {
+            "jsonrpc": "2.0",
+            "method": "notifications/initialized",
+            "params": {}
+        }
+        print(f"Writing to stdin: {json.dumps(message)}")
+        return message
+
+    def _ready(self, started_at):
+        self.startup_time = time.monotonic() - started_at
+        print(f"Server {self.server_name} ready in {self.startup_time:.2f}s")
+        return True
+
+    def _parse_line(self, line, pipe_name):
+        """Returns the JSON message on a line of the server's output, or None if it is not JSON."""
+        try:
+            return codec.loads(line)
+        except codec.JSONDecodeError as e:
+            print(f"{pipe_name} (invalid JSON): {line}")
+            print(f"JSON Error: {e}. This means the MCP server is not giving JSON responses.")
+            return None
+
+    def _dispatch_message(self, message):
+        """Completes the pending future whose id matches a response from the server."""
+        # the answer to a batch is an array of responses
+        if isinstance(message, list):
+            for item in message:
+                self._dispatch_message(item)
+            return
+
+        # an error without an id is how a JSON-RPC server rejects a batch it cannot parse
+        probe = self.batch_probe
+        if isinstance(message, dict) and message.get("id") is None and "error" in message and probe is not None:
+            if not probe.done():
+                probe.set_result(message)
+            return
+
+        # requests sent by the server carry an id of their own, only responses complete futures
+        if isinstance(message, dict) and "method" not in message:
+            with self.req_lock:
+                future = self.pending.pop(message.get("id"), None)
+                late = future is None and message.get("id") in self.cancelled
+                if late:
+                    self.cancelled.remove(message.get("id"))
+            if future is not None:
+                if not future.done():
+                    future.set_result(message)
+                return
+            if late:
+                return
+
+        self.messages.append(message)
+
+    def _fail_pending(self, error):
+        with self.req_lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _timed_out(self, request_id, timeout):
+        """Stops waiting on a request that got no answer in time, and returns the error to raise."""
+        self._forget(request_id)
+        return TimeoutError(f"{self.server_name} did not answer request {request_id} within {timeout}s")
+
+    def _cancel_message(self, request_id, reason):
+        """Drops request_id's response if it still arrives, and returns the notification cancelling it."""
+        with self.req_lock:
+            self.cancelled.append(request_id)
+        return {
+            "jsonrpc": "2.0",
+            "method": "notifications/cancelled",
+            "params": {"requestId": request_id, "reason": reason}
+        }
+
+    def _tool_timeout(self, method, timeout):
+        """`timeout` if given, else the tool's manifest "timeout", else None for request_timeout."""
+        return timeout if timeout is not None else self.tool_timeouts.get(method)
+
+    def _note_quota(self, response):
+        """Slows this server's bucket down when a tool failed on quota, and lets it recover otherwise."""
+        if is_quota_error(response):
+            self.rate_limit.penalize()
+        else:
+            self.rate_limit.succeeded()
+
+
+class MCPClient(JSONRPCClient):
+    def __init__(self, server_name, server_config):
+        super().__init__(server_name, server_config)
+        self.write_lock = threading.Lock()
+        # None until the server has been probed, see _supports_batch
+        self.batch_supported = None if server_config.get("batch") else False
+        self.batch_probe_timeout = server_config.get("batch_probe_timeout", 2)
+        self.batch_lock = threading.Lock()
         self.stdout = None # thread
         self.stderr = None # thread
-        self.messages = []
-        self.stderr_logs = []
 
         self.engage_mcp_server()
 
@@ -32,116 +288,596 @@ class MCPClient:
     """
     def engage_mcp_server(self):
 
+        started_at = time.monotonic()
+        try:
+            self._start_transport()
+        except Exception as e:
+            print(f"Error starting server {self.server_name}: {e}")
+            return False
+
 
+        init_id, init_future = self._register_request()
+        self._write_message(self._initialize_message(init_id))
+
+        # the server is only ready once it has answered initialize
+        try:
+            init_response = self._wait_for_response(init_id, init_future, self.startup_timeout)
+        except (TimeoutError, ConnectionError) as e:
+            print(f"Error initializing server {self.server_name}: {e}")
+            return False
+
+        if not self._accept_initialize(init_response):
+            return False
+        self._write_message(self._initialized_message())
+        return self._ready(started_at)
+
+
+
+
+    def _start_transport(self):
+        """Starts the server process and the threads reading its stdout and stderr."""
+        # start the server
+        print(f"Starting server {self.server_name}...")
+        print(self.server_config["startup"])
+        self.process = subprocess.Popen(
+            self.server_config["startup"],
+            cwd=self.server_config["cwd"] if self.server_config["cwd"] else os.getcwd(),
+            env=server_env(self.server_config),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,  
+            universal_newlines=True
+        )
+        
+
+        def read_stdout(pipe, pipe_name):
+            """Read and parse JSON messages from stdout"""
+            print(f"Reading stdout from {pipe_name}...")
+            for line in iter(pipe.readline, ""):
+                line = line.strip()
+                if line:
+                    message = self._parse_line(line, pipe_name)
+                    if message is not None:
+                        self._dispatch_message(message)
+
+            # the server closed its stdout, nobody is going to answer the pending requests
+            self._fail_pending(ConnectionError(f"{self.server_name} closed its stdout"))
+        
+        def read_stderr(pipe, pipe_name):
+            """Read stderr logs (usually debug info, not JSON)"""
+            print(f"Reading stderr from {pipe_name}...")
+            for line in iter(pipe.readline, ""):
+                line = line.strip()
+                if line:
+                    # Store the log
+                    self.stderr_logs.append(line)
+                    self.stderr_sink.write(line)
+        
+        self.stdout_callback = read_stdout
+        self.stderr_callback = read_stderr
+
+        # Start the output reading threads
+        self.stdout = threading.Thread(target=self.stdout_callback, args=(self.process.stdout, f"{self.server_name}-stdout"), daemon=True)
+        self.stdout.start()
+        self.stderr = threading.Thread(target=self.stderr_callback, args=(self.process.stderr, f"{self.server_name}-stderr"), daemon=True)
+        self.stderr.start()
+
+    def _new_future(self):
+        return Future()
+
+    def _write_message(self, message):
+        """Writes one JSON-RPC message as a single line on the server's stdin."""
+        with self.write_lock:
+            self.process.stdin.write(codec.dumps(message) + "\n")
+            self.process.stdin.flush()
+
+    def _wait_for_response(self, request_id, future, timeout=None):
+        """Blocks until the response for request_id arrives, or raises TimeoutError."""
+        timeout = self.request_timeout if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise self._timed_out(request_id, timeout)
+
+    def _request(self, method, params, timeout=None):
+        """Sends a JSON-RPC request and blocks for its response."""
+        request_id, future = self._register_request()
+        try:
+            self._write_message(self._request_message(request_id, method, params))
+        except Exception:
+            self._forget(request_id)
+            raise
+
+        try:
+            return self._wait_for_response(request_id, future, timeout)
+        except TimeoutError as e:
+            self._cancel(request_id, str(e))
+            raise
+
+    def _cancel(self, request_id, reason):
+        """Tells the server to stop working on request_id, whose response will be dropped."""
+        try:
+            self._write_message(self._cancel_message(request_id, reason))
+        except Exception as e:
+            print(f"Could not cancel request {request_id} on {self.server_name}: {e}")
+
+    def send_request(self, method, arguments, timeout=None):
+        """
+        Calls a tool and blocks for its response.
+
+        Waits `timeout` seconds, else the tool's manifest "timeout", else request_timeout. When the
+        deadline passes the request is cancelled on the server and TimeoutError is raised.
+        """
+        self.rate_limit.acquire()
+        response = self._request("tools/call", {"name": method, "arguments": arguments}, self._tool_timeout(method, timeout))
+        self._note_quota(response)
+        return response
+
+    def _supports_batch(self):
+        """Finds out once, with a batch holding a single ping, whether the server answers JSON-RPC batches."""
+        with self.batch_lock:
+            if self.batch_supported is None:
+                self.batch_supported = self._probe_batch()
+                print(f"Server {self.server_name} {'accepts' if self.batch_supported else 'does not accept'} batch requests")
+            return self.batch_supported
+
+    def _probe_batch(self):
+        request_id, future = self._register_request()
+        self.batch_probe = Future()
+        try:
+            self._write_message([{"jsonrpc": "2.0", "id": request_id, "method": "ping"}])
+            # servers that drop batches silently are only caught by the timeout
+            done, _ = wait([future, self.batch_probe], timeout=self.batch_probe_timeout, return_when=FIRST_COMPLETED)
+        except Exception:
+            done = set()
+        finally:
+            self.batch_probe = None
+
+        if self._forget(request_id):
+            with self.req_lock:
+                self.cancelled.append(request_id)
+        return future in done and future.exception() is None and "result" in future.result()
+
+    def send_batch(self, calls, timeout=None):
+        """
+        Calls several tools at once and returns their responses in the order of calls.
+
+        With "batch" set in the manifest, and once the server has been seen to answer batches, the
+        calls go out as a single JSON-RPC batch array in one write. Otherwise each call is written
+        on its own, still all in flight together. Each call keeps its own timeout and cancellation,
+        and a failed call comes back as its exception instead of raising.
+        """
+        self.rate_limit.acquire(len(calls))
+        requests = []
+        for method, arguments in calls:
+            request_id, future = self._register_request()
+            request = self._request_message(request_id, "tools/call", {"name": method, "arguments": arguments})
+            item_timeout = self._tool_timeout(method, timeout)
+            requests.append((request_id, future, request, self.request_timeout if item_timeout is None else item_timeout))
+
+        sent_at = time.monotonic()
+        batched = False
+        if len(requests) > 1 and self.batch_supported is not False and self._supports_batch():
+            try:
+                self._write_message([request for _, _, request, _ in requests])
+                batched = True
+            except Exception as e:
+                print(f"Server {self.server_name} rejected a batch, sending requests one by one: {e}")
+                self.batch_supported = False
+
+        if not batched:
+            for request_id, future, request, _ in requests:
+                try:
+                    self._write_message(request)
+                except Exception as e:
+                    self._forget(request_id)
+                    future.set_exception(e)
+
+        responses = []
+        for request_id, future, _, item_timeout in requests:
+            remaining = max(0, sent_at + item_timeout - time.monotonic())
+            try:
+                response = self._wait_for_response(request_id, future, remaining)
+                self._note_quota(response)
+                responses.append(response)
+            except TimeoutError as e:
+                self._cancel(request_id, str(e))
+                responses.append(e)
+            except Exception as e:
+                responses.append(e)
+        return responses
+
+    def ping(self, timeout=5):
+        """Returns True if the server answers an MCP ping within timeout."""
+        try:
+            response = self._request("ping", {}, timeout)
+        except (TimeoutError, ConnectionError, OSError, ValueError, httpx.HTTPError):
+            return False
+        return "result" in response
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self, timeout=5):
+        """Terminates the server process and fails any request still waiting on it."""
+        self._fail_pending(ConnectionError(f"{self.server_name} was closed"))
+        if not self.is_alive():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+# origin -> httpx.Client, so every client talking to the same server shares one keep-alive pool
+_http_pools = {}
+_http_pools_lock = threading.Lock()
+
+
+def get_http_pool(url, server_config):
+    """Returns the pooled keep-alive HTTP client for the origin of url, creating it on first use."""
+    origin = str(httpx.URL(url).copy_with(path="/", query=None, fragment=None))
+    with _http_pools_lock:
+        pool = _http_pools.get(origin)
+        if pool is None or pool.is_closed:
+            max_connections = server_config.get("http_max_connections", 10)
+            pool = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                    keepalive_expiry=server_config.get("http_keepalive", 60)
+                ),
+                timeout=httpx.Timeout(server_config.get("request_timeout", 60), connect=10)
+            )
+            _http_pools[origin] = pool
+        return pool
+
+
+def _iter_sse(lines):
+    """Yields (event, data) pairs from the lines of a text/event-stream body."""
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            value = line[len("data:"):]
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class HTTPMCPClient(MCPClient):
+    """
+    Base for MCP clients that talk to an already running server over HTTP instead of spawning one.
+
+    The server is given by the manifest's "url" field, and requests go through the keep-alive
+    pool shared by every client of that origin, so many Aegis processes can use one warm server.
+    """
+
+    def __init__(self, server_name, server_config):
+        self.url = server_config["url"]
+        self.http = get_http_pool(self.url, server_config)
+        self.closed = threading.Event()
+        super().__init__(server_name, server_config)
+
+    def _dispatch_line(self, line, source):
+        message = self._parse_line(line, source)
+        if message is not None:
+            self._dispatch_message(message)
+
+    def _fail_request(self, message, error):
+        with self.req_lock:
+            future = self.pending.pop(message.get("id"), None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def is_alive(self):
+        return not self.closed.is_set()
+
+    def close(self, timeout=5):
+        self.closed.set()
+        self._fail_pending(ConnectionError(f"{self.server_name} was closed"))
+
+
+class SSEMCPClient(HTTPMCPClient):
+    """
+    HTTP+SSE transport ("io": "sse"), as served by the calendar server's main_sse.
+
+    Responses arrive on one long-lived event stream opened on "url"; its first "endpoint" event
+    tells the client where to POST requests.
+    """
+
+    def __init__(self, server_name, server_config):
+        self.endpoint = None
+        self.endpoint_ready = threading.Event()
+        self.stream = None
+        super().__init__(server_name, server_config)
+
+    def _start_transport(self):
+        print(f"Connecting to server {self.server_name} at {self.url}...")
+        self.stdout = threading.Thread(target=self._read_events, name=f"{self.server_name}-sse", daemon=True)
+        self.stdout.start()
+
+        if not self.endpoint_ready.wait(self.startup_timeout) or self.endpoint is None:
+            self.close()
+            raise ConnectionError(f"{self.server_name} did not announce a message endpoint")
+
+    def _read_events(self):
+        source = f"{self.server_name}-sse"
+        try:
+            # the stream stays open for the life of the client, so only connecting is bounded
+            with self.http.stream("GET", self.url, headers={"Accept": "text/event-stream"}, timeout=httpx.Timeout(None, connect=10)) as response:
+                self.stream = response
+                response.raise_for_status()
+                for event, data in _iter_sse(response.iter_lines()):
+                    if event == "endpoint":
+                        self.endpoint = urljoin(self.url, data)
+                        self.endpoint_ready.set()
+                    elif event == "message":
+                        self._dispatch_line(data, source)
+        except Exception as e:
+            if not self.closed.is_set():
+                print(f"{source}: event stream failed: {e}")
+        finally:
+            self.closed.set()
+            self.endpoint_ready.set()
+            self._fail_pending(ConnectionError(f"{self.server_name} closed its event stream"))
+
+    def _write_message(self, message):
+        response = self.http.post(self.endpoint, content=codec.dumps(message), headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+
+    def close(self, timeout=5):
+        super().close(timeout)
+        if self.stream is not None:
+            self.stream.close()
+
+
+class StreamableHTTPMCPClient(HTTPMCPClient):
+    """
+    Streamable HTTP transport ("io": "streamable-http").
+
+    Every request is its own POST to "url", answered with either a JSON body or a short event
+    stream. Requests are posted from a small worker pool, so callers wait on their futures with
+    the usual timeouts and several requests can be in flight on pooled connections.
+    """
+
+    def __init__(self, server_name, server_config):
+        self.session_id = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=server_config.get("http_max_connections", 10),
+            thread_name_prefix=f"{server_name}-http"
+        )
+        super().__init__(server_name, server_config)
+
+    def _start_transport(self):
+        print(f"Connecting to server {self.server_name} at {self.url}...")
+
+    def _headers(self):
+        headers = {
+            "Accept": "application/json, text/event-stream",
+            "Content-Type": "application/json"
+        }
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        return headers
+
+    def _post(self, message):
+        source = f"{self.server_name}-http"
+        try:
+            with self.http.stream("POST", self.url, content=codec.dumps(message), headers=self._headers()) as response:
+                if "mcp-session-id" in response.headers:
+                    self.session_id = response.headers["mcp-session-id"]
+                if response.status_code == 202:
+                    return
+                response.raise_for_status()
+
+                if response.headers.get("content-type", "").startswith("text/event-stream"):
+                    for event, data in _iter_sse(response.iter_lines()):
+                        if event == "message":
+                            self._dispatch_line(data, source)
+                else:
+                    self._dispatch_line(response.read().decode(), source)
+        except Exception as e:
+            retry_after = quota_retry_after(e)
+            if retry_after is not False:
+                self.rate_limit.penalize(retry_after)
+            if "id" in message:
+                self._fail_request(message, ConnectionError(f"{self.server_name} request failed: {e}"))
+            else:
+                raise
+
+    def _write_message(self, message):
+        if self.closed.is_set():
+            raise ConnectionError(f"{self.server_name} was closed")
+        # notifications are answered with 202 straight away, requests wait on the worker pool
+        if "id" in message:
+            self.executor.submit(self._post, message)
+        else:
+            self._post(message)
+
+    def close(self, timeout=5):
+        super().close(timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.session_id:
+            try:
+                self.http.delete(self.url, headers=self._headers(), timeout=timeout)
+            except httpx.HTTPError:
+                pass
+
+
+def create_mcp_client(server_name, server_config):
+    """Creates the threaded client for the transport named by the manifest's "io" field."""
+    io = server_config.get("io", "stdio")
+    if io == "sse":
+        return SSEMCPClient(server_name, server_config)
+    if io in ("streamable-http", "http"):
+        return StreamableHTTPMCPClient(server_name, server_config)
+    return MCPClient(server_name, server_config)
+
+
+class AsyncMCPClient(JSONRPCClient):
+    """
+    asyncio counterpart of MCPClient.
+
+    The server runs under asyncio.create_subprocess_exec and is read by two tasks instead of threads,
+    so any number of tools/call requests can be in flight on the same stdio pipe at once and
+    complete in whatever order the server answers them. Its futures are completed on the loop
+    it was engaged on, and every method must be called there.
+    """
+
+    def __init__(self, server_name, server_config):
+        super().__init__(server_name, server_config)
+        self.stdout = None # task
+        self.stderr = None # task
+
+    async def engage_mcp_server(self):
+        """Starts the process and performs the initialize handshake. Must be awaited before send_request."""
+        started_at = time.monotonic()
         try:
-            # start the server
             print(f"Starting server {self.server_name}...")
             print(self.server_config["startup"])
-            self.process = subprocess.Popen(
-                self.server_config["startup"],
+            self.process = await asyncio.create_subprocess_exec(
+                *self.server_config["startup"],
                 cwd=self.server_config["cwd"] if self.server_config["cwd"] else os.getcwd(),
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,  
-                universal_newlines=True
+                env=server_env(self.server_config),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # a single tool result is one line, and can be far larger than the 64KB default
+                limit=self.server_config.get("stream_limit", 16 * 1024 * 1024)
             )
-            
-
-            def read_stdout(pipe, pipe_name):
-                """Read and parse JSON messages from stdout"""
-                print(f"Reading stdout from {pipe_name}...")
-                for line in iter(pipe.readline, ""):
-                    line = line.strip()
-                    if line:
-                        try:
-                            # Parse the JSON message
-                            message = json.loads(line)
-                            # Store the message
-                            self.messages.append(message)
-                        except json.JSONDecodeError as e:
-                            print(f"{pipe_name} (invalid JSON): {line}")
-                            print(f"JSON Error: {e}. This means the MCP server is not giving JSON responses.")
-            
-            def read_stderr(pipe, pipe_name):
-                """Read stderr logs (usually debug info, not JSON)"""
-                print(f"Reading stderr from {pipe_name}...")
-                for line in iter(pipe.readline, ""):
-                    line = line.strip()
-                    if line:
-                        # Store the log
-                        self.stderr_logs.append(line)
-                        # Print the log
-                        print(f"{pipe_name}: {line}")
-            
-            self.stdout_callback = read_stdout
-            self.stderr_callback = read_stderr
-
-            # Start the output reading threads
-            self.stdout = threading.Thread(target=self.stdout_callback, args=(self.process.stdout, f"{self.server_name}-stdout"), daemon=True)
-            self.stdout.start()
-            self.stderr = threading.Thread(target=self.stderr_callback, args=(self.process.stderr, f"{self.server_name}-stderr"), daemon=True)
-            self.stderr.start()
 
+            self.stdout = asyncio.create_task(self._read_stdout(f"{self.server_name}-stdout"))
+            self.stderr = asyncio.create_task(self._read_stderr(f"{self.server_name}-stderr"))
 
         except Exception as e:
             print(f"Error starting server {self.server_name}: {e}")
             return False
 
+        init_id, init_future = self._register_request()
+        await self._write_message(self._initialize_message(init_id))
 
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": self.req_id,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2025-03-26",
-                "capabilities": {},
-                "clientInfo": {
-                    "name": "aegis",
-                    "version": "0.1.0"
-                }
-            }
-        }
+        try:
+            init_response = await self._wait_for_response(init_id, init_future, self.startup_timeout)
+        except (TimeoutError, ConnectionError) as e:
+            print(f"Error initializing server {self.server_name}: {e}")
+            return False
 
-        self.req_id += 1
+        if not self._accept_initialize(init_response):
+            return False
+        await self._write_message(self._initialized_message())
+        return self._ready(started_at)
 
-        self.process.stdin.write(json.dumps(init_request) + "\n")
-        self.process.stdin.flush()
-        
-        initialized_notification = {
-            "jsonrpc": "2.0",
-            "method": "notifications/initialized",
-            "params": {}
-        }
-        time.sleep(3)
+    async def _read_stdout(self, pipe_name):
+        """Read and parse JSON messages from stdout"""
+        print(f"Reading stdout from {pipe_name}...")
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line:
+                message = self._parse_line(line, pipe_name)
+                if message is not None:
+                    self._dispatch_message(message)
 
-        print(f"Writing to stdin: {json.dumps(initialized_notification)}")
-        self.process.stdin.write(json.dumps(initialized_notification) + '\n')
-        self.process.stdin.flush()
+        self._fail_pending(ConnectionError(f"{self.server_name} closed its stdout"))
 
+    async def _read_stderr(self, pipe_name):
+        """Read stderr logs (usually debug info, not JSON)"""
+        print(f"Reading stderr from {pipe_name}...")
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                break
+            line = line.decode(errors="replace").strip()
+            if line:
+                self.stderr_logs.append(line)
+                self.stderr_sink.write(line)
 
-        return True
+    def _new_future(self):
+        return asyncio.get_running_loop().create_future()
 
+    async def _write_message(self, message):
+        # a single write() call per line keeps concurrent requests from interleaving
+        self.process.stdin.write((codec.dumps(message) + "\n").encode())
+        await self.process.stdin.drain()
 
+    async def _wait_for_response(self, request_id, future, timeout=None):
+        timeout = self.request_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(request_id, timeout)
 
+    async def _request(self, method, params, timeout=None):
+        request_id, future = self._register_request()
+        try:
+            await self._write_message(self._request_message(request_id, method, params))
+        except Exception:
+            self._forget(request_id)
+            raise
 
-    def send_request(self, method, arguments):
-        request = {
-            "jsonrpc": "2.0",
-            "id": self.req_id,
-            "method": "tools/call",
-            "params": {
-                "name": method,
-                "arguments": arguments
-            }
-        }
-        self.process.stdin.write(json.dumps(request) + "\n")
-        self.process.stdin.flush()
-        self.req_id += 1
+        try:
+            return await self._wait_for_response(request_id, future, timeout)
+        except TimeoutError as e:
+            await self._cancel(request_id, str(e))
+            raise
+
+    async def _cancel(self, request_id, reason):
+        try:
+            await self._write_message(self._cancel_message(request_id, reason))
+        except Exception as e:
+            print(f"Could not cancel request {request_id} on {self.server_name}: {e}")
 
-        time.sleep(5)
+    async def send_request(self, method, arguments, timeout=None):
+        await self.rate_limit.acquire_async()
+        response = await self._request("tools/call", {"name": method, "arguments": arguments}, self._tool_timeout(method, timeout))
+        self._note_quota(response)
+        return response
 
-        return self.messages[-1]
+    async def send_requests(self, calls, timeout=None):
+        """
+        Pipelines several tools/call requests on the pipe at once.
 
-        
+        calls is a list of (method, arguments) pairs. Results are returned in the order of calls,
+        with an exception in place of any request that failed.
+        """
+        return await asyncio.gather(
+            *(self.send_request(method, arguments, timeout) for method, arguments in calls),
+            return_exceptions=True
+        )
+
+    async def ping(self, timeout=5):
+        """Returns True if the server answers an MCP ping within timeout."""
+        try:
+            response = await self._request("ping", {}, timeout)
+        except (TimeoutError, ConnectionError, OSError):
+            return False
+        return "result" in response
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def close(self, timeout=5):
+        """Terminates the server process and fails any request still waiting on it."""
+        self._fail_pending(ConnectionError(f"{self.server_name} was closed"))
+        if not self.is_alive():
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
@@ -0,0 +1,36 @@
+"""
+JSON encoding for MCP messages and tool results.
+
+Uses orjson when it is installed and the standard library otherwise. Output is always compact,
+since it goes over a pipe or socket rather than to a person. Set AEGIS_JSON_CODEC=json to force
+the standard library.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None and os.getenv("AEGIS_JSON_CODEC", "orjson") == "orjson":
+    name = "orjson"
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    name = "json"
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+    def loads(data):
+        return json.loads(data)
+
+# orjson.JSONDecodeError subclasses it, so callers can catch this for either codec
+JSONDecodeError = json.JSONDecodeError
@@ -0,0 +1,91 @@
+"""
+Compaction of MCPController.accept_query conversations, which are resent in full on every call.
+
+Once the history is estimated above its token budget, function responses the model has already
+answered (a model turn follows them) are swapped, oldest first, for a short summary and a handle
+to the full result, which the model can get back by calling recall_result. The prompt and the
+query are pinned, and each function call keeps a response of the same name, as Gemini requires.
+"""
+
+from google.genai.types import FunctionDeclaration, Part
+
+from projection import estimate_tokens
+
+RECALL_FUNCTION = "recall_result"
+
+RECALL_DECLARATION = FunctionDeclaration(
+    name=RECALL_FUNCTION,
+    description="Returns the full result of an earlier function call that was shortened to a summary, by its handle",
+    parameters={
+        "type": "object",
+        "properties": {
+            "handle": {
+                "type": "string",
+                "description": "The handle given with the summary"
+            }
+        },
+        "required": ["handle"]
+    },
+)
+
+# keys whose value names a record well enough to stand in for it in a summary
+TITLE_KEYS = ("summary", "subject", "name", "title", "id")
+
+
+def summarize(value, limit=5):
+    """A short, deterministic description of a tool result."""
+    if isinstance(value, dict):
+        for key in TITLE_KEYS:
+            if isinstance(value.get(key), str):
+                return value[key][:80]
+        lists = {key: item for key, item in value.items() if isinstance(item, list)}
+        if lists:
+            return "; ".join(f"{key}: {summarize(item, limit)}" for key, item in lists.items())
+        return f"object with {', '.join(list(value)[:10])}"
+    if isinstance(value, list):
+        titles = [summarize(item, limit) for item in value[:limit]]
+        more = f" and {len(value) - limit} more" if len(value) > limit else ""
+        return f"{len(value)} items ({', '.join(titles)}{more})"
+    return str(value)[:80]
+
+
+def part_tokens(part):
+    return estimate_tokens(part.model_dump(mode="json", exclude_none=True))
+
+
+class HistoryCompactor:
+    """Keeps one conversation's history under `budget` estimated tokens."""
+
+    def __init__(self, budget=8000):
+        self.budget = budget
+        # handle -> the full response it replaced
+        self.archive = {}
+
+    def recall(self, handle):
+        return self.archive.get(handle)
+
+    def compact(self, history):
+        """Compacts history in place and returns (estimated tokens before, after)."""
+        sizes = [part_tokens(item) for item in history]
+        before = total = sum(sizes)
+
+        # responses are consumed once a model turn comes after them; the pinned prompt and query come first
+        last_model_turn = max((i for i, item in enumerate(history) if getattr(item, "role", None) == "model"), default=-1)
+        for i in range(2, last_model_turn):
+            if total <= self.budget:
+                break
+            response = getattr(history[i], "function_response", None)
+            if response is None or (response.response or {}).get("handle"):
+                continue
+
+            handle = f"{response.name}#{len(self.archive) + 1}"
+            self.archive[handle] = response.response
+            history[i] = Part.from_function_response(
+                name=response.name,
+                response={"summary": summarize((response.response or {}).get("result")), "handle": handle}
+            )
+            new_size = part_tokens(history[i])
+            total -= sizes[i] - new_size
+            sizes[i] = new_size
+
+        return before, total
@@ -0,0 +1,133 @@
+"""
+Vertex AI context caching of the stable prefix of an LLMCaller's requests.
+
+A caller registers the parts every one of its requests starts with (an MCP server's control
+prompt, the graph schema of text to Cypher). The first request creates a CachedContent holding
+those parts and the caller's tools, keyed by a hash of the model, the parts and the tools, so a
+changed manifest or schema gets a cache of its own. Later requests send only what follows the
+prefix and reference the cache. Its TTL is extended shortly before it runs out.
+
+When a cache cannot be created (e.g. a prefix under the model's minimum cacheable size), requests
+go out whole, and creation is not tried again for that prefix until a TTL has passed.
+"""
+
+import threading
+import time
+
+from google.genai.types import Content, CreateCachedContentConfig, UpdateCachedContentConfig
+
+from llmcache import SingleFlight, cache_key
+
+
+class ContextCache:
+    """Cached contents by prefix, created on first use and kept alive while used, with token and latency stats."""
+
+    def __init__(self, ttl=3600, refresh_margin=300):
+        self.ttl = ttl
+        # a cache used within this many seconds of expiring has its TTL extended
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        # key -> {"name": cached content name or None, "expires": time.monotonic() timestamp}
+        self.entries = {}
+        self.in_flight = SingleFlight()
+
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+        # requests with and without a cache: count, input tokens, tokens read from the cache, seconds
+        self.usage = {
+            cached: {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "seconds": 0.0}
+            for cached in (True, False)
+        }
+
+    def configure(self, ttl):
+        self.ttl = ttl
+
+    def _create(self, llm_client, model, prefix, tools):
+        cached_content = llm_client.caches.create(model=model, config=CreateCachedContentConfig(
+            contents=[Content(role="user", parts=prefix)],
+            tools=tools,
+            ttl=f"{self.ttl}s",
+            display_name=f"aegis-{model}",
+        ))
+        with self.lock:
+            self.created += 1
+        print(f"Context cache {cached_content.name} created for {model}")
+        return cached_content.name
+
+    def name(self, llm_client, model, prefix, tools=None):
+        """Returns the name of the cached content for prefix and tools, creating or refreshing it, or None."""
+        key = cache_key(model, prefix, tools)
+        name = self._fresh(key)
+        if name is not False:
+            return name
+        # the calls to Vertex AI are made outside the lock, once per key however many callers need it
+        return self.in_flight.do(key, lambda: self._renew(key, llm_client, model, prefix, tools))
+
+    def _fresh(self, key):
+        """Returns the name stored for key (None if creation failed) while it is not due for a refresh, else False."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires"] - time.monotonic() > self.refresh_margin:
+                return entry["name"]
+            return False
+
+    def _renew(self, key, llm_client, model, prefix, tools):
+        # a call that just finished for the same key may have renewed it already
+        name = self._fresh(key)
+        if name is not False:
+            return name
+
+        with self.lock:
+            entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry["name"] is not None:
+            try:
+                llm_client.caches.update(name=entry["name"], config=UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+                with self.lock:
+                    entry["expires"] = now + self.ttl
+                    self.refreshed += 1
+                return entry["name"]
+            except Exception as e:
+                # expired or deleted server side, make a new one
+                print(f"Context cache {entry['name']} could not be refreshed: {e}")
+
+        try:
+            name = self._create(llm_client, model, prefix, tools)
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+            print(f"Context cache for {model} not created, sending prompts whole: {e}")
+            name = None
+        with self.lock:
+            self.entries[key] = {"name": name, "expires": now + self.ttl}
+        return name
+
+    def record(self, usage_metadata, seconds, cached):
+        """Counts one response's input tokens and latency, for requests made with or without a cache."""
+        usage = self.usage[cached]
+        with self.lock:
+            usage["calls"] += 1
+            usage["seconds"] += seconds
+            if usage_metadata is not None:
+                usage["prompt_tokens"] += usage_metadata.prompt_token_count or 0
+                usage["cached_tokens"] += usage_metadata.cached_content_token_count or 0
+
+    def stats(self):
+        with self.lock:
+            cached, uncached = self.usage[True], self.usage[False]
+            return {
+                "caches": sum(1 for entry in self.entries.values() if entry["name"]),
+                "created": self.created,
+                "refreshed": self.refreshed,
+                "failures": self.failures,
+                "cached_calls": cached["calls"],
+                "uncached_calls": uncached["calls"],
+                # share of the input tokens of cached calls that were read from the cache
+                "cached_token_share": cached["cached_tokens"] / cached["prompt_tokens"] if cached["prompt_tokens"] else 0.0,
+                "mean_latency_cached": cached["seconds"] / cached["calls"] if cached["calls"] else None,
+                "mean_latency_uncached": uncached["seconds"] / uncached["calls"] if uncached["calls"] else None,
+            }
+
+
+context_cache = ContextCache()
@@ -0,0 +1,15 @@
+"""JSON encoding for Gmail MCP tool results, a copy of the calendar server's utils/codec.py."""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """Serialize obj as compact JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, separators=(",", ":"), default=str)
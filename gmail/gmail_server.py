@@ -1,5 +1,7 @@
+import asyncio
 import os
 import logging
+import functools
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 from mcp.server.fastmcp import FastMCP, Context
@@ -32,6 +34,35 @@ mcp = FastMCP(
     dependencies=["google-api-python-client", "google-auth-oauthlib"]
 )
 
+import codec
+
+STRUCTURED_CONTENT = os.getenv("MCP_STRUCTURED_CONTENT") == "1"
+
+def tool():
+    """
+    Register a tool returning a dict.
+
+    By default the result is sent once, as compact JSON text. With MCP_STRUCTURED_CONTENT=1 it is
+    also sent as structuredContent, which the client can use without parsing the text.
+    """
+    def decorator(func):
+        # the Gmail client blocks, so each call runs on a worker thread and concurrent calls overlap
+        @functools.wraps(func)
+        async def in_thread(*args, **kwargs):
+            return await asyncio.to_thread(asyncio.run, func(*args, **kwargs))
+
+        if STRUCTURED_CONTENT:
+            mcp.tool()(in_thread)
+            return func
+
+        @functools.wraps(func)
+        async def as_json_text(*args, **kwargs):
+            return codec.dumps(await in_thread(*args, **kwargs))
+
+        mcp.tool(structured_output=False)(as_json_text)
+        return func
+    return decorator
+
 # Gmail Service Initialization
 CLIENT_FILE = '../credentials-web.json'
 
@@ -46,7 +77,7 @@ def get_gmail_service(email_identifier: str):
         raise
 
 # Resources
-@mcp.tool()
+@tool()
 async def get_inbox(email_identifier: str) -> Dict[str, Any]:
     """Get latest emails from inbox"""
     try:
@@ -67,7 +98,23 @@ async def get_inbox(email_identifier: str) -> Dict[str, Any]:
         logger.error(f"Error fetching inbox: {str(e)}")
         return {"success": False, "message": str(e)}
 
-@mcp.tool()
+@tool()
+async def list_inbox(email_identifier: str, max_results: int = 10) -> Dict[str, Any]:
+    """List the IDs of the latest emails in the inbox, without their contents"""
+    try:
+        logger.info(f"Listing inbox for {email_identifier}")
+        service = get_gmail_service(email_identifier)
+        messages, next_page = get_email_messages(service, max_results=max_results)
+        return {
+            "success": True,
+            "messages": [msg['id'] for msg in messages],
+            "has_more": bool(next_page)
+        }
+    except Exception as e:
+        logger.error(f"Error listing inbox: {str(e)}")
+        return {"success": False, "message": str(e)}
+
+@tool()
 async def get_email_details(email_identifier: str, msg_id: str) -> Dict[str, Any]:
     """Get detailed information about a specific email"""
     try:
@@ -81,7 +128,7 @@ async def get_email_details(email_identifier: str, msg_id: str) -> Dict[str, Any
         logger.error(f"Error fetching email details: {str(e)}")
         return {"success": False, "message": str(e)}
 
-@mcp.tool()
+@tool()
 async def list_attachments(email_identifier: str, msg_id: str) -> Dict[str, Any]:
     """List attachments for a specific email"""
     try:
@@ -103,7 +150,7 @@ async def list_attachments(email_identifier: str, msg_id: str) -> Dict[str, Any]
         return {"success": False, "message": str(e)}
 
 # Tools
-@mcp.tool()
+@tool()
 async def send_gmail(
     email_identifier: str, 
     to: str, 
@@ -148,7 +195,7 @@ async def send_gmail(
         logger.error(f"Error sending email: {str(e)}")
         return {"success": False, "message": str(e)}
 
-@mcp.tool()
+@tool()
 async def search_email_tool(
     email_identifier: str,
     query: str = '',
@@ -185,7 +232,7 @@ async def search_email_tool(
         logger.error(f"Error searching emails: {str(e)}")
         return {"success": False, "message": str(e), "emails": []}
 
-@mcp.tool()
+@tool()
 async def read_latest_emails(
     email_identifier: str,
     max_results: int = 5,
@@ -227,7 +274,7 @@ async def read_latest_emails(
         logger.error(f"Error reading latest emails: {str(e)}")
         return {"success": False, "message": str(e), "emails": []}
 
-@mcp.tool()
+@tool()
 async def download_email_attachments(
     email_identifier: str,
     msg_id: str,
@@ -1,10 +1,16 @@
 # google_apis.py
 import os
+import threading
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 
+from ratelimit import google_request_builder
+
+# tool calls run on worker threads; one at a time reads, refreshes and rewrites the token file
+token_lock = threading.Lock()
+
 def create_service(client_secret_file, api_name, api_version, *scopes, prefix=''):
     CLIENT_SECRET_FILE = client_secret_file
     API_SERVICE_NAME = api_name
@@ -16,27 +22,31 @@ def create_service(client_secret_file, api_name, api_version, *scopes, prefix=''
     working_dir = os.getcwd()
     token_file = 'token.json'
 
-    if os.path.exists(os.path.join(working_dir, token_file)):
-        creds = Credentials.from_authorized_user_file(
-            os.path.join(working_dir, token_file), SCOPES
-        )
-    else:
-        creds = None
-
-    # If no valid credentials, initiate the authentication flow
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+    with token_lock:
+        if os.path.exists(os.path.join(working_dir, token_file)):
+            creds = Credentials.from_authorized_user_file(
+                os.path.join(working_dir, token_file), SCOPES
+            )
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
-            creds = flow.run_local_server(port=8080)
+            creds = None
+
+        # If no valid credentials, initiate the authentication flow
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
+                creds = flow.run_local_server(port=8080)
 
-        # Save the credentials for future use
-        with open(os.path.join(working_dir, token_file), 'w') as token:
-            token.write(creds.to_json())
+            # Save the credentials for future use
+            tmp_file = os.path.join(working_dir, f'{token_file}.tmp')
+            with open(tmp_file, 'w') as token:
+                token.write(creds.to_json())
+            os.replace(tmp_file, os.path.join(working_dir, token_file))
 
     try:
-        service = build(API_SERVICE_NAME, API_VERSION, credentials=creds, static_discovery=False)
+        service = build(API_SERVICE_NAME, API_VERSION, credentials=creds, static_discovery=False,
+                        requestBuilder=google_request_builder(API_SERVICE_NAME))
         print(f'{API_SERVICE_NAME} {API_VERSION} service created successfully for {prefix}')
         return service
     except Exception as e:
@@ -0,0 +1,163 @@
+"""
+Rate limiting of the server's Google API requests.
+
+A copy of the Aegis client's ratelimit.py, trimmed to what a server needs, so the server runs
+without the client's tree on its path. Requests take a token from the "google:<api>" bucket and
+only wait when it is empty. A 429 or quota error halves the bucket's rate and pauses it for the
+server's Retry-After; every success raises the rate again, a step at a time. GET requests are also
+retried after a jittered exponential backoff on 5xx responses and dropped connections.
+
+Limits are read from AEGIS_RATE_LIMITS, a JSON object of bucket name to requests per second or to
+{"rate": ..., "burst": ...}, which Aegis passes to the servers it spawns.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+DEFAULT_RATE = 10
+
+# error texts that mean "slow down" rather than "not allowed"
+QUOTA_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "RESOURCE_EXHAUSTED", "Too Many Requests")
+
+# statuses worth retrying as they are: timeouts and server errors
+TRANSIENT_STATUSES = {408, 500, 502, 503, 504}
+
+
+def backoff(attempt, base=0.5, cap=30):
+    """Seconds to wait before retry `attempt` (0 for the first): full jitter over an exponential ceiling."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on quota errors (halving) and recovers on success (additive)."""
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 64
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Takes tokens, going into debt if there are not enough, and waits until they may be used."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+
+            delay = max(0.0, self.paused_until - now)
+            if self.tokens < 0:
+                delay = max(delay, -self.tokens / self.rate)
+        if delay:
+            time.sleep(delay)
+
+    def penalize(self, retry_after=None):
+        """Called on a 429 or quota error: halves the rate and holds every caller back for retry_after seconds."""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        """Called after a successful call: moves the rate back towards its maximum."""
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def error_status(error):
+    """Returns (HTTP status or None, response or None) of a googleapiclient HttpError."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "resp", None)
+    if not isinstance(status, int) and response is not None:
+        status = getattr(response, "status", None)
+    return (status if isinstance(status, int) else None), response
+
+
+def quota_retry_after(error):
+    """
+    Returns how long to back off for error (None if the server did not say), or False when error
+    is not a rate limit at all.
+    """
+    status, response = error_status(error)
+    if status != 429 and not any(reason in str(error) for reason in QUOTA_REASONS):
+        return False
+    try:
+        return float(response.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Registry of named token buckets, created on first use from the configured or default rates."""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, name):
+        with self.lock:
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                limit = self.limits.get(name, DEFAULT_RATE)
+                if not isinstance(limit, dict):
+                    limit = {"rate": limit}
+                bucket = self.buckets[name] = TokenBucket(name, limit["rate"], limit.get("burst"))
+            return bucket
+
+    def call(self, name, func, retries=3, retry_transient=True):
+        """
+        Calls func once a token is free, retrying it up to `retries` times when it fails on quota or,
+        unless retry_transient is False, transiently.
+        """
+        bucket = self.bucket(name)
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                retry_after = quota_retry_after(e)
+                if retry_after is not False:
+                    bucket.penalize(retry_after)
+                    continue
+                if retry_transient and (isinstance(e, ConnectionError) or error_status(e)[0] in TRANSIENT_STATUSES):
+                    time.sleep(backoff(attempt))
+                    continue
+                raise
+            bucket.succeeded()
+            return result
+
+
+limiter = RateLimiter(json.loads(os.getenv("AEGIS_RATE_LIMITS", "{}")))
+
+
+def google_request_builder(api):
+    """
+    Returns a googleapiclient requestBuilder (for discovery.build) whose requests go through the
+    "google:<api>" bucket. Only GET requests are retried on transient errors, since a write may
+    have gone through.
+    """
+    from googleapiclient.http import HttpRequest
+
+    class RateLimitedRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            return limiter.call(
+                f"google:{api}",
+                lambda: HttpRequest.execute(self, http=http, num_retries=num_retries),
+                retry_transient=self.method == "GET"
+            )
+
+    return RateLimitedRequest
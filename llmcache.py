@@ -0,0 +1,184 @@
+"""
+Persistent cache of model responses, for LLMCaller.call_llm calls that opt in with cache=True.
+
+Responses are stored in SQLite under a hash of the model, the request contents and the tools
+config, so a prompt only ever hits the cache with the exact input it was answered for (graph
+extraction over unchanged data, the Cypher for a repeated question, routing). The least recently
+used entries are evicted beyond `max_entries`.
+
+Identical calls in flight at the same time are coalesced by SingleFlight whether they cache or
+not: the first goes to the model, and the others wait for and share its response.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from google.genai.types import GenerateContentResponse
+
+RESPONSE_CACHE_PATH = os.path.join(".aegis-cache", "llm-responses.sqlite3")
+
+
+def dump(value):
+    """A canonical JSON form of contents or a config, pydantic models included."""
+    if hasattr(value, "model_dump"):
+        return dump(value.model_dump(mode="json", exclude_none=True))
+    if isinstance(value, (list, tuple)):
+        return [dump(item) for item in value]
+    if isinstance(value, dict):
+        return {key: dump(item) for key, item in value.items()}
+    return value
+
+
+def cache_key(model, contents, config=None):
+    payload = json.dumps([model, dump(contents), dump(config)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite store of GenerateContentResponses at `path`, LRU bounded to `max_entries`."""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # opened on first use, so a run that never caches never creates the file
+        self.connection = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_entries):
+        self.max_entries = max_entries
+
+    def _connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, used REAL NOT NULL)"
+            )
+        return self.connection
+
+    def get(self, key):
+        """Returns the stored response for key, or None."""
+        with self.lock:
+            connection = self._connect()
+            row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            connection.commit()
+            self.hits += 1
+        return GenerateContentResponse.model_validate_json(row[0])
+
+    def put(self, key, response):
+        """Stores a response that has a candidate; blocked or empty responses are never cached."""
+        if not response.candidates or not response.candidates[0].content:
+            return
+        with self.lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, used) VALUES (?, ?, ?)",
+                (key, response.model_dump_json(exclude_none=True), time.time())
+            )
+            evicted = connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            connection.commit()
+            self.evictions += evicted
+
+    def stats(self):
+        with self.lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = ResponseCache()
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs share its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> Future of the call in flight
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """Returns (Future of the call for key, whether the caller is to make it)."""
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self.in_flight[key] = Future()
+            self.calls += 1
+            return future, True
+
+    def _done(self, key):
+        with self.lock:
+            del self.in_flight[key]
+
+    def do(self, key, func):
+        """Returns func(), or the result of the identical call already in flight (raising its error)."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+        except BaseException:
+            # waiters get a CancelledError rather than blocking forever on a KeyboardInterrupt
+            future.cancel()
+            raise
+        finally:
+            self._done(key)
+        return future.result()
+
+    async def do_async(self, key, func):
+        """Async version of do, for a func returning an awaitable; sync and async callers share calls."""
+        future, leader = self._join(key)
+        if not leader:
+            # shielded, so a waiter giving up does not cancel the call for everyone else
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._done(key)
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+single_flight = SingleFlight()
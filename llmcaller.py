@@ -1,30 +1,184 @@
+import asyncio
 import os
+import threading
+import time
 from google import genai
-from google.genai.types import Part
+from google.genai.types import GenerateContentConfig, Part
+
+from contextcache import context_cache
+from llmcache import cache_key, response_cache, single_flight
+from ratelimit import limiter
+
+# every LLMCaller's async calls run on this one event loop thread, so the genai client's async
+# connection pool and the per-model semaphores are only ever used from the loop they belong to
+_loop = None
+_loop_lock = threading.Lock()
+# model -> asyncio.Semaphore bounding its calls in flight, sized by the first LLMCaller to call it
+_semaphores = {}
+
+
+def llm_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+        return _loop
+
 
 class LLMCaller:
     """ Responsible for calling an LLM and returning the response """
-    def __init__(self, tools_config=None):
+    def __init__(self, tools_config=None, max_concurrency=8, timeout=120):
         self.llm_client = None
         self.tools_config = tools_config
+        self.model = "gemini-2.0-flash-lite-001"
+        # async calls per model in flight at once, shared by every LLMCaller of the model; the
+        # first caller of a model to make an async call sets it, later values are ignored
+        self.max_concurrency = max_concurrency
+        # seconds an async call may take, retries included
+        self.timeout = timeout
+        # the parts every request starts with, sent as Vertex cached content once use_context_cache is called
+        self.cached_prefix = None
         self.init_llm_client()
 
     
     def init_llm_client(self):
         self.llm_client = genai.Client(vertexai=True, project=os.environ["GOOGLE_CLOUD_PROJECT"], location=os.environ["GOOGLE_CLOUD_LOCATION"])
 
-    def call_llm(self, prompt, conversation_history=None):
+    def _contents(self, prompt, conversation_history=None):
         if conversation_history:
-            response = self.llm_client.models.generate_content(
-                model="gemini-2.0-flash-lite-001",
-                contents = conversation_history + [Part.from_text(text=prompt)],
-                config=self.tools_config
-            )
+            return conversation_history + [Part.from_text(text=prompt)]
+        return [Part.from_text(text=prompt)]
+
+    def use_context_cache(self, prefix):
+        """
+        Has requests whose contents start with the parts in prefix send only the rest, referencing
+        a cached content of prefix and the tools (see contextcache.py).
+        """
+        self.cached_prefix = list(prefix)
+
+    def _request(self, contents):
+        """
+        Returns (contents, config, cached) to send for contents, where cached says whether a context
+        cache is referenced, and is None when contents do not start with the cached prefix at all.
+        """
+        prefix = self.cached_prefix
+        if not prefix or len(contents) <= len(prefix) or contents[:len(prefix)] != prefix:
+            return contents, self.tools_config, None
+
+        tools = self.tools_config.tools if self.tools_config else None
+        name = context_cache.name(self.llm_client, self.model, prefix, tools)
+        if not name:
+            return contents, self.tools_config, False
+        # the tools are part of the cached content, and may not be sent alongside it
+        if self.tools_config:
+            config = self.tools_config.model_copy(update={"tools": None, "cached_content": name})
         else:
-            response = self.llm_client.models.generate_content(
-                model="gemini-2.0-flash-lite-001",
-                contents = [Part.from_text(text=prompt)],
-                config=self.tools_config
-            )
+            config = GenerateContentConfig(cached_content=name)
+        return contents[len(prefix):], config, True
+
+    def _record(self, usage_metadata, seconds, cached):
+        if cached is not None:
+            context_cache.record(usage_metadata, seconds, cached)
+
+    def call_llm(self, prompt, conversation_history=None, cache=False):
+        """
+        Returns the model's response to prompt. An identical call already in flight (same model,
+        contents and tools config) is waited for rather than repeated, whether or not it caches.
+        With cache=True, a stored response is returned without calling the model, and the response
+        is stored (see llmcache.py).
+        """
+        contents = self._contents(prompt, conversation_history)
+
+        key = cache_key(self.model, contents, self.tools_config)
+        if cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        def generate():
+            request_contents, config, cached_prefix = self._request(contents)
+            started_at = time.monotonic()
+            # waits only when the model's quota would be exceeded, and backs off on 429s
+            response = limiter.call(f"llm:{self.model}", lambda: self.llm_client.models.generate_content(
+                model=self.model,
+                contents=request_contents,
+                config=config
+            ))
+            self._record(response.usage_metadata, time.monotonic() - started_at, cached_prefix)
+            if cache:
+                response_cache.put(key, response)
+            return response
+
+        return single_flight.do(key, generate)
+
+    async def _generate_async(self, contents, config, deadline):
+        """Runs on the llm loop."""
+        semaphore = _semaphores.get(self.model)
+        if semaphore is None:
+            # only the loop thread gets here, so there is no race to create it
+            semaphore = _semaphores[self.model] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            return await limiter.call_async(f"llm:{self.model}", lambda: self.llm_client.aio.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=config
+            ), deadline=deadline)
+
+    async def call_llm_async(self, prompt, conversation_history=None, cache=False, timeout=None):
+        """
+        Async version of call_llm, so a caller can await many calls at once with asyncio.gather.
+        At most max_concurrency calls per model are sent at a time, and 429s and transient errors
+        are retried with backoff until the deadline, `timeout` seconds (self.timeout by default)
+        from now, raising a TimeoutError.
+        """
+        contents = self._contents(prompt, conversation_history)
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        key = cache_key(self.model, contents, self.tools_config)
+        if cache:
+            cached = await asyncio.to_thread(response_cache.get, key)
+            if cached is not None:
+                return cached
+
+        async def generate():
+            request_contents, config, cached_prefix = await asyncio.to_thread(self._request, contents)
+            started_at = time.monotonic()
+            future = asyncio.run_coroutine_threadsafe(self._generate_async(request_contents, config, deadline), llm_loop())
+            response = await asyncio.wrap_future(future)
+            self._record(response.usage_metadata, time.monotonic() - started_at, cached_prefix)
+            if cache:
+                await asyncio.to_thread(response_cache.put, key, response)
+            return response
+
+        return await single_flight.do_async(key, generate)
+
+    def stream_llm(self, prompt, conversation_history=None):
+        """
+        Like call_llm, but yields the response in chunks as it is generated. Each chunk is a
+        GenerateContentResponse holding only the new text (chunk.text); function calls arrive whole,
+        and the last chunk carries usage_metadata.
+        """
+        contents, config, cached_prefix = self._request(self._contents(prompt, conversation_history))
+
+        def start():
+            stream = iter(self.llm_client.models.generate_content_stream(
+                model=self.model,
+                contents=contents,
+                config=config
+            ))
+            # the request is made when the first chunk is asked for, so quota errors are retried here
+            return stream, next(stream, None)
 
-        return response
+        started_at = time.monotonic()
+        stream, first = limiter.call(f"llm:{self.model}", start)
+        # a stream's latency is the time to its first chunk
+        first_chunk_time = time.monotonic() - started_at
+        usage_metadata = None
+        if first is not None:
+            usage_metadata = first.usage_metadata
+            yield first
+            for chunk in stream:
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                yield chunk
+        self._record(usage_metadata, first_chunk_time, cached_prefix)
@@ -2,6 +2,7 @@
 
 import json
 import os
+import threading
 from pathlib import Path
 from typing import Optional
 import sys
@@ -12,6 +13,10 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 
 from .scopes import SCOPES
 
+# tool calls run on worker threads, and all of them authorize: one at a time, so only one refreshes
+# the token or starts the OAuth flow, and the credentials are reused while they stay valid
+_auth_lock = threading.Lock()
+_creds: Optional[Credentials] = None
 
 
 
@@ -43,11 +48,21 @@ def load_saved_credentials() -> Optional[Credentials]:
 def save_credentials(creds: Credentials) -> None:
     """Save credentials to token.json."""
     token_path = get_token_path()
-    token_path.write_text(creds.to_json())
+    tmp_path = token_path.with_name(f"{token_path.name}.tmp")
+    tmp_path.write_text(creds.to_json())
+    os.replace(tmp_path, token_path)
 
 
 def authorize(token_path: str, credentials_path: str) -> Credentials:
     """Authorize and return Google Calendar API credentials."""
+    global _creds
+    with _auth_lock:
+        if _creds is None or not _creds.valid:
+            _creds = _authorize(token_path, credentials_path)
+        return _creds
+
+
+def _authorize(token_path: str, credentials_path: str) -> Credentials:
     import sys
     print("Starting Google Calendar authentication...", file=sys.stderr)
 
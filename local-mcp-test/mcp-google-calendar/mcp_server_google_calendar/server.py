@@ -1,11 +1,11 @@
 """Google Calendar MCP Server implementation."""
 
-import json
+import asyncio
 import os
 import sys
 import argparse
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import pytz
 from googleapiclient.discovery import build
@@ -16,7 +16,9 @@ import mcp.types as types
 from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
 
+
 from .auth import authorize
+from .utils.ratelimit import google_request_builder
 from .tools import GOOGLE_CALENDAR_TOOLS
 from .schemas import (
     CreateEventRequest,
@@ -25,7 +27,7 @@ from .schemas import (
     DeleteEventRequest,
     FreeBusyRequest,
 )
-from .utils import cool_log, logs
+from .utils import cool_log, dumps, logs, structured_content_enabled
 
 
 # Create server instance
@@ -58,6 +60,16 @@ def get_user_timezone(calendar: Any) -> str:
         return _user_timezone
 
 
+def tool_result(
+    payload: Dict[str, Any]
+) -> Union[List[types.TextContent], Tuple[List[types.TextContent], Dict[str, Any]]]:
+    """Wrap a tool's result as compact JSON text, or as structuredContent only when enabled."""
+    if structured_content_enabled():
+        # the client reads structuredContent directly, so no text copy is sent
+        return [], payload
+    return [types.TextContent(type="text", text=dumps(payload))]
+
+
 def validate_and_fix_datetime(dt_string: Optional[str], default_timezone: str = "UTC") -> Optional[str]:
     """Validate and fix datetime format to include timezone if missing."""
     if not dt_string:
@@ -124,14 +136,22 @@ async def handle_list_tools() -> List[types.Tool]:
 @server.call_tool()
 async def handle_call_tool(
     name: str, arguments: Optional[Dict[str, Any]]
-) -> List[types.TextContent]:
-    """Handle tool calls."""
+) -> Union[List[types.TextContent], Tuple[List[types.TextContent], Dict[str, Any]]]:
+    """Handle tool calls, each on a worker thread so concurrent requests are not serialized."""
+    # the Google API client blocks; every call builds its own service, so threads share no connection
+    return await asyncio.to_thread(asyncio.run, call_tool(name, arguments))
+
+
+async def call_tool(
+    name: str, arguments: Optional[Dict[str, Any]]
+) -> Union[List[types.TextContent], Tuple[List[types.TextContent], Dict[str, Any]]]:
+    """Run one tool call."""
     if arguments is None:
         arguments = {}
 
     # Authorize and build calendar service
     creds = authorize(token_path=os.getenv("GOOGLE_APPLICATION_TOKENS"), credentials_path=os.getenv("GOOGLE_APPLICATION_CREDENTIALS_WEB"))
-    calendar = build("calendar", "v3", credentials=creds)
+    calendar = build("calendar", "v3", credentials=creds, requestBuilder=google_request_builder("calendar"))
 
     try:
         if name == "get-events":
@@ -149,23 +169,13 @@ async def handle_call_tool(
                 orderBy=request_data.orderBy,
             ).execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps(result, indent=2),
-                )
-            ]
+            return tool_result(result)
 
         elif name == "list-calendars":
             # List all calendars
             result = calendar.calendarList().list().execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps(result, indent=2),
-                )
-            ]
+            return tool_result(result)
 
         elif name == "get-timezone-info":
             # Get timezone information
@@ -185,19 +195,9 @@ async def handle_call_tool(
                     "timezone_name": now_local.tzname()
                 }
                 
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps(result, indent=2),
-                    )
-                ]
+                return tool_result(result)
             except Exception as e:
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps({"error": f"Error getting timezone info: {str(e)}"}, indent=2),
-                    )
-                ]
+                return tool_result({"error": f"Error getting timezone info: {str(e)}"})
 
         elif name == "get-current-date":
             # Get current date and time
@@ -221,19 +221,9 @@ async def handle_call_tool(
                     "timestamp": int(now_local.timestamp())
                 }
                 
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps(result, indent=2),
-                    )
-                ]
+                return tool_result(result)
             except Exception as e:
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps({"error": f"Error getting current date: {str(e)}"}, indent=2),
-                    )
-                ]
+                return tool_result({"error": f"Error getting current date: {str(e)}"})
 
         elif name == "check-availability":
             # Validate arguments
@@ -244,12 +234,7 @@ async def handle_call_tool(
                 body=request_data.model_dump(exclude_none=True)
             ).execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps(result, indent=2),
-                )
-            ]
+            return tool_result(result)
 
         elif name == "create-event":
             # Validate arguments
@@ -306,15 +291,10 @@ async def handle_call_tool(
             )
 
             if not is_available:
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps({
-                            "error": "Time slot is not available - there are overlapping events",
-                            "status": "CONFLICT"
-                        }, indent=2),
-                    )
-                ]
+                return tool_result({
+                    "error": "Time slot is not available - there are overlapping events",
+                    "status": "CONFLICT"
+                })
             
             # Create the event
             result = calendar.events().insert(
@@ -324,18 +304,13 @@ async def handle_call_tool(
                 supportsAttachments=bool(event_data.get("attachments")),
             ).execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps({
-                        "success": True,
-                        "event": result,
-                        "message": f"Event '{request_data.summary}' created successfully from {request_data.start_datetime} to {request_data.end_datetime} ({user_tz})",
-                        "event_link": result.get("htmlLink"),
-                        "event_id": result.get("id")
-                    }, indent=2),
-                )
-            ]
+            return tool_result({
+                "success": True,
+                "event": result,
+                "message": f"Event '{request_data.summary}' created successfully from {request_data.start_datetime} to {request_data.end_datetime} ({user_tz})",
+                "event_link": result.get("htmlLink"),
+                "event_id": result.get("id")
+            })
 
         elif name == "delete-event":
             # Validate arguments
@@ -348,15 +323,10 @@ async def handle_call_tool(
                 sendUpdates=request_data.sendUpdates,
             ).execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps({
-                        "success": True,
-                        "message": f"Event {request_data.eventId} deleted successfully"
-                    }, indent=2),
-                )
-            ]
+            return tool_result({
+                "success": True,
+                "message": f"Event {request_data.eventId} deleted successfully"
+            })
 
         elif name == "update-event":
             # Validate arguments
@@ -414,26 +384,16 @@ async def handle_call_tool(
                     )
 
                     if not is_available:
-                        return [
-                            types.TextContent(
-                                type="text",
-                                text=json.dumps({
-                                    "error": "New time slot is not available - there are overlapping events",
-                                    "status": "CONFLICT"
-                                }, indent=2),
-                            )
-                        ]
+                        return tool_result({
+                            "error": "New time slot is not available - there are overlapping events",
+                            "status": "CONFLICT"
+                        })
             
             # If no fields to update, return error
             if not update_data:
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=json.dumps({
-                            "error": "No fields provided to update. Please specify at least one field to update."
-                        }, indent=2),
-                    )
-                ]
+                return tool_result({
+                    "error": "No fields provided to update. Please specify at least one field to update."
+                })
 
             # Update the event
             result = calendar.events().patch(
@@ -443,18 +403,13 @@ async def handle_call_tool(
                 sendUpdates=request_data.sendUpdates,
             ).execute()
 
-            return [
-                types.TextContent(
-                    type="text",
-                    text=json.dumps({
-                        "success": True,
-                        "event": result,
-                        "message": f"Event '{result.get('summary', request_data.eventId)}' updated successfully",
-                        "updated_fields": list(update_data.keys()),
-                        "event_link": result.get("htmlLink")
-                    }, indent=2),
-                )
-            ]
+            return tool_result({
+                "success": True,
+                "event": result,
+                "message": f"Event '{result.get('summary', request_data.eventId)}' updated successfully",
+                "updated_fields": list(update_data.keys()),
+                "event_link": result.get("htmlLink")
+            })
 
         else:
             raise ValueError(f"Unknown tool: {name}")
@@ -1,6 +1,5 @@
 """Google Calendar MCP Server implementation with SSE support using FastMCP."""
 
-import json
 import sys
 import argparse
 from typing import Optional
@@ -15,7 +14,9 @@ import uvicorn
 
 from mcp.server.fastmcp import FastMCP
 
+
 from .auth import authorize
+from .utils.ratelimit import google_request_builder
 from .schemas import (
     CreateEventRequest,
     ListEventsRequest,
@@ -23,7 +24,7 @@ from .schemas import (
     DeleteEventRequest,
     FreeBusyRequest,
 )
-from .utils import cool_log, logs
+from .utils import cool_log, dumps, logs
 
 # Create FastMCP server instance
 mcp = FastMCP("Google Calendar MCP Server")
@@ -42,7 +43,7 @@ def get_calendar_service():
     
     # Authenticate and create new service (only once)
     creds = authorize(token_path=os.getenv("GOOGLE_APPLICATION_TOKENS"), credentials_path=os.getenv("GOOGLE_APPLICATION_CREDENTIALS_WEB"))
-    _calendar_service = build("calendar", "v3", credentials=creds)
+    _calendar_service = build("calendar", "v3", credentials=creds, requestBuilder=google_request_builder("calendar"))
     return _calendar_service
 
 
@@ -52,7 +53,7 @@ def initialize_calendar_service():
     try:
         print("🚀 Starting Google Calendar MCP Server with SSE transport...")
         creds = authorize(token_path=os.getenv("GOOGLE_APPLICATION_TOKENS"), credentials_path=os.getenv("GOOGLE_APPLICATION_CREDENTIALS_WEB"))
-        _calendar_service = build("calendar", "v3", credentials=creds)
+        _calendar_service = build("calendar", "v3", credentials=creds, requestBuilder=google_request_builder("calendar"))
         print("✅ Authentication successful!")
         
         # Initialize timezone
@@ -262,13 +263,13 @@ def get_events(
             orderBy=request_data.orderBy,
         ).execute()
 
-        return json.dumps(result, indent=2)
+        return dumps(result)
         
     except ValidationError as e:
         error_msg = f"Invalid arguments: {'; '.join([f'{err['loc'][0] if err['loc'] else 'root'}: {err['msg']}' for err in e.errors()])}"
-        return json.dumps({"error": error_msg}, indent=2)
+        return dumps({"error": error_msg})
     except Exception as e:
-        return json.dumps({"error": f"Error calling Google Calendar API: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error calling Google Calendar API: {str(e)}"})
 
 
 @mcp.tool()
@@ -277,9 +278,9 @@ def list_calendars() -> str:
     try:
         calendar = get_calendar_service()
         result = calendar.calendarList().list().execute()
-        return json.dumps(result, indent=2)
+        return dumps(result)
     except Exception as e:
-        return json.dumps({"error": f"Error listing calendars: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error listing calendars: {str(e)}"})
 
 
 @mcp.tool()
@@ -294,16 +295,16 @@ def get_timezone_info() -> str:
         user_tz_obj = pytz.timezone(user_tz)
         now_local = now_utc.astimezone(user_tz_obj)
         
-        return json.dumps({
+        return dumps({
             "timezone": user_tz,
             "current_utc_time": now_utc.isoformat(),
             "current_local_time": now_local.isoformat(),
             "utc_offset": now_local.strftime("%z"),
             "timezone_name": now_local.tzname()
-        }, indent=2)
+        })
         
     except Exception as e:
-        return json.dumps({"error": f"Error getting timezone info: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error getting timezone info: {str(e)}"})
 
 
 @mcp.tool()
@@ -325,7 +326,7 @@ def get_current_date() -> str:
         user_tz_obj = pytz.timezone(user_tz)
         now_local = now_utc.astimezone(user_tz_obj)
         
-        return json.dumps({
+        return dumps({
             "current_date": now_local.strftime("%Y-%m-%d"),
             "current_time": now_local.strftime("%H:%M:%S"),
             "current_datetime": now_local.strftime("%Y-%m-%d %H:%M:%S"),
@@ -335,10 +336,10 @@ def get_current_date() -> str:
             "formatted_date": now_local.strftime("%B %d, %Y"),
             "utc_datetime": now_utc.isoformat(),
             "timestamp": int(now_local.timestamp())
-        }, indent=2)
+        })
         
     except Exception as e:
-        return json.dumps({"error": f"Error getting current date: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error getting current date: {str(e)}"})
 
 
 @mcp.tool()
@@ -374,13 +375,13 @@ def check_availability(
             body=request_data.model_dump(exclude_none=True)
         ).execute()
 
-        return json.dumps(result, indent=2)
+        return dumps(result)
         
     except ValidationError as e:
         error_msg = f"Invalid arguments: {'; '.join([f'{err['loc'][0] if err['loc'] else 'root'}: {err['msg']}' for err in e.errors()])}"
-        return json.dumps({"error": error_msg}, indent=2)
+        return dumps({"error": error_msg})
     except Exception as e:
-        return json.dumps({"error": f"Error checking availability: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error checking availability: {str(e)}"})
 
 
 @mcp.tool()
@@ -463,12 +464,12 @@ def create_event(
         )
 
         if conflict_check["has_conflicts"]:
-            return json.dumps({
+            return dumps({
                 "error": "Time slot is not available - there are overlapping events",
                 "status": "CONFLICT",
                 "conflicting_events": conflict_check["conflicts"],
                 "conflict_check_error": conflict_check["error"]
-            }, indent=2)
+            })
 
         # Build event data
         event_data = {
@@ -513,19 +514,19 @@ def create_event(
             supportsAttachments=bool(event_data.get("attachments")),
         ).execute()
 
-        return json.dumps({
+        return dumps({
             "success": True,
             "event": result,
             "message": f"Event '{summary}' created successfully from {start_datetime} to {end_datetime} ({user_tz})",
             "event_link": result.get("htmlLink"),
             "event_id": result.get("id")
-        }, indent=2)
+        })
         
     except ValidationError as e:
         error_msg = f"Invalid arguments: {'; '.join([f'{err['loc'][0] if err['loc'] else 'root'}: {err['msg']}' for err in e.errors()])}"
-        return json.dumps({"error": error_msg}, indent=2)
+        return dumps({"error": error_msg})
     except Exception as e:
-        return json.dumps({"error": f"Error creating event: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error creating event: {str(e)}"})
 
 
 
@@ -553,16 +554,16 @@ def delete_event(
             sendUpdates=request_data.sendUpdates,
         ).execute()
 
-        return json.dumps({
+        return dumps({
             "success": True,
             "message": f"Event {request_data.eventId} deleted successfully"
-        }, indent=2)
+        })
         
     except ValidationError as e:
         error_msg = f"Invalid arguments: {'; '.join([f'{err['loc'][0] if err['loc'] else 'root'}: {err['msg']}' for err in e.errors()])}"
-        return json.dumps({"error": error_msg}, indent=2)
+        return dumps({"error": error_msg})
     except Exception as e:
-        return json.dumps({"error": f"Error deleting event: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error deleting event: {str(e)}"})
 
 
 @mcp.tool()
@@ -682,18 +683,18 @@ def update_event(
                 )
 
                 if conflict_check["has_conflicts"]:
-                    return json.dumps({
+                    return dumps({
                         "error": "New time slot is not available - there are overlapping events",
                         "status": "CONFLICT",
                         "conflicting_events": conflict_check["conflicts"],
                         "conflict_check_error": conflict_check["error"]
-                    }, indent=2)
+                    })
         
         # If no fields to update, return error
         if not update_data:
-            return json.dumps({
+            return dumps({
                 "error": "No fields provided to update. Please specify at least one field to update."
-            }, indent=2)
+            })
 
         # Update the event
         result = calendar.events().patch(
@@ -703,19 +704,19 @@ def update_event(
             sendUpdates=request_data.sendUpdates,
         ).execute()
 
-        return json.dumps({
+        return dumps({
             "success": True,
             "event": result,
             "message": f"Event '{result.get('summary', eventId)}' updated successfully",
             "updated_fields": list(update_data.keys()),
             "event_link": result.get("htmlLink")
-        }, indent=2)
+        })
         
     except ValidationError as e:
         error_msg = f"Invalid arguments: {'; '.join([f'{err['loc'][0] if err['loc'] else 'root'}: {err['msg']}' for err in e.errors()])}"
-        return json.dumps({"error": error_msg}, indent=2)
+        return dumps({"error": error_msg})
     except Exception as e:
-        return json.dumps({"error": f"Error updating event: {str(e)}"}, indent=2)
+        return dumps({"error": f"Error updating event: {str(e)}"})
 
 
 
@@ -727,6 +728,7 @@ def main_sse():
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
     parser.add_argument("--port", type=int, default=8000, help="Port to bind to")
     parser.add_argument("--log-level", default="info", help="Log level")
+    parser.add_argument("--transport", default="sse", choices=["sse", "streamable-http"], help="HTTP transport to serve")
     args = parser.parse_args()
 
     # Initialize Google Calendar service
@@ -734,11 +736,13 @@ def main_sse():
         sys.exit(1)
 
     print(f"🌐 Server starting on http://{args.host}:{args.port}")
-    print(f"📡 SSE endpoint: http://{args.host}:{args.port}/sse")
-    
-    # Run the FastMCP server with SSE transport
-    # Get the SSE app from FastMCP
-    app = mcp.sse_app()
+    if args.transport == "streamable-http":
+        print(f"📡 Streamable HTTP endpoint: http://{args.host}:{args.port}/mcp")
+        app = mcp.streamable_http_app()
+    else:
+        print(f"📡 SSE endpoint: http://{args.host}:{args.port}/sse")
+        # Get the SSE app from FastMCP
+        app = mcp.sse_app()
     
     # Run with uvicorn
     uvicorn.run(
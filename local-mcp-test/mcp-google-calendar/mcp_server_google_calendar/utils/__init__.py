@@ -1,5 +1,6 @@
 """Utility functions for Google Calendar MCP server."""
 
+from .codec import dumps, structured_content_enabled
 from .logs import cool_log, logs
 
-__all__ = ["cool_log", "logs"] 
\ No newline at end of file
+__all__ = ["cool_log", "dumps", "logs", "structured_content_enabled"] 
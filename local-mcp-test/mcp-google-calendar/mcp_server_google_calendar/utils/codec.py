@@ -0,0 +1,22 @@
+"""JSON encoding for Google Calendar MCP tool results."""
+
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """Serialize obj as compact JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+def structured_content_enabled() -> bool:
+    """Whether results are returned as structuredContent (MCP_STRUCTURED_CONTENT=1) instead of JSON text."""
+    return os.getenv("MCP_STRUCTURED_CONTENT") == "1"
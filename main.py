@@ -1,8 +1,12 @@
 from dotenv import load_dotenv
+import asyncio
 import json
 from neo4j_connector import Neo4JConnector
 from sorter import Sorter
 from llmcaller import LLMCaller
+from llmcache import response_cache, single_flight
+from contextcache import context_cache
+from google.genai.types import Part
 load_dotenv()
 
 class AegisEngine:
@@ -15,6 +19,7 @@ class AegisEngine:
 
         self.graph_metadata = None
         self.graph_metadata_string = None
+        self.cypher_prompt = None
         self._get_graph_metadata()
 
         self.accept_query("Whats the latest in my email?")
@@ -23,11 +28,22 @@ class AegisEngine:
     def pull_data(self):
         self.latest_data = self.sorter.pull_all_data()
 
-        for service_name in self.latest_data.keys():
-            graph = self.build_relationship_graph_from_data(self.latest_data[service_name], service_name)
+        # every service's graph is extracted at once; a service whose extraction fails is skipped
+        async def build_graphs():
+            return await asyncio.gather(*(
+                self.build_relationship_graph_from_data(data, service_name)
+                for service_name, data in self.latest_data.items()
+            ), return_exceptions=True)
+
+        for service_name, graph in zip(self.latest_data.keys(), asyncio.run(build_graphs())):
+            if isinstance(graph, Exception):
+                print(f"Error extracting the graph of {service_name}: {graph}")
+                continue
             cyphers = self.build_cyphers_from_graph(graph)
             self.neo4j_connector.perform_cypher_query(cyphers)
 
+        print(f"LLM response cache: {response_cache.stats()}, coalesced calls: {single_flight.stats()}")
+
 
 
 
@@ -67,12 +83,9 @@ class AegisEngine:
 
         self.graph_metadata_string = f"Nodes: {nodes}\nRelationships: {relationships}"
 
-    def accept_query(self, query):
-
-        print("GRAPH METADATA")
-        print(self.graph_metadata_string)
-
-        prompt = f"""
+        # the instructions and the schema start every text to Cypher request, and are cached by Vertex
+        # until the schema changes
+        self.cypher_prompt = Part.from_text(text=f"""
         You are an expert Neo4j data analyst who translates natural language questions into precise, read-only Cypher queries. Your task is to generate a single, valid Cypher query that answers the user's question, based only on the provided graph schema.
 
         ## Rules & Constraints
@@ -87,14 +100,29 @@ class AegisEngine:
         ## Your Task
         Graph Schema:
         {self.graph_metadata_string}
+        """)
+        self.llm_caller.use_context_cache([self.cypher_prompt])
 
+    def accept_query(self, query):
+        for text in self.stream_query(query):
+            print(text, end="", flush=True)
+        print()
+        print(f"Context cache: {context_cache.stats()}")
+
+    def stream_query(self, query):
+        """Generator version of accept_query, yielding the answer's text as it is generated."""
+
+        print("GRAPH METADATA")
+        print(self.graph_metadata_string)
+
+        prompt = f"""
         User's Question:
         {query}
 
         Cypher Query:
         """
 
-        response = self.llm_caller.call_llm(prompt)
+        response = self.llm_caller.call_llm(prompt, conversation_history=[self.cypher_prompt], cache=True)
 
         text = response.candidates[0].content.parts[0].text
 
@@ -122,14 +150,13 @@ class AegisEngine:
             Answer:
             """
 
-            response2 = self.llm_caller.call_llm(prompt2)
-            text2 = response2.candidates[0].content.parts[0].text
-
-            print(text2)
+            for chunk in self.llm_caller.stream_llm(prompt2):
+                if chunk.text:
+                    yield chunk.text
 
         
 
-    def build_relationship_graph_from_data(self, data, service_name):
+    async def build_relationship_graph_from_data(self, data, service_name):
 
         purposes = None
         with open("aegis-manifest.json", "r") as f:
@@ -177,7 +204,7 @@ class AegisEngine:
         """
 
 
-        response = self.llm_caller.call_llm(prompt)
+        response = await self.llm_caller.call_llm_async(prompt, cache=True)
 
         graph = {}
         for part in response.candidates[0].content.parts:
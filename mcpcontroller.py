@@ -1,10 +1,18 @@
 import sys
 sys.path.append('mcp-client')
-from client import MCPClient
-from google.genai.types import FunctionDeclaration, Tool, Schema, Part, GenerateContentConfig
+from client import AsyncMCPClient, create_mcp_client
+from supervisor import MCPSupervisor
+from google.genai.types import FunctionDeclaration, Tool, Schema, Part, Content, GenerateContentConfig
+import asyncio
+import threading
 import time
 from llmcaller import LLMCaller
 import json
+import codec
+from resultcache import ToolResultCache
+from projection import ResultProjector
+from compaction import RECALL_DECLARATION, RECALL_FUNCTION, HistoryCompactor
+from pullplans import TEMPLATE_HELP, PlanExecutor, manifest_key, plan_cache, render
 
 class MCPController:
     """
@@ -16,10 +24,30 @@ class MCPController:
     
     """
 
-    def __init__(self, server_name, server_config):
+    def __init__(self, server_name, server_config, lazy=False):
+        if server_config.get("client") == "asyncio" and server_config.get("supervise"):
+            # MCPSupervisor only wraps the threaded clients, and running unsupervised would go unnoticed
+            raise ValueError(f'{server_name}: "supervise" is not supported with "client": "asyncio"')
         self.server_name = server_name
         self.server_config = server_config
-        self.mcp_client = MCPClient(server_name, server_config)
+        self.loop = None
+        self.mcp_client = None
+        self.client_lock = threading.Lock()
+        # held while a server starts, so callers arriving meanwhile wait for it instead of starting another
+        self.start_lock = threading.Lock()
+        # tool calls currently using the client, the idle shutdown waits for them
+        self.in_flight = 0
+        self.idle_timeout = server_config.get("idle_timeout")
+        self.idle_timer = None
+        # results of the read-only tools the manifest gives a "cache_ttl"
+        self.result_cache = ToolResultCache(server_config.get("tools", []), server_config.get("result_cache_size", 256))
+        self.projector = ResultProjector(server_config)
+        if not lazy:
+            try:
+                self.mcp_client = self._create_client()
+            except ConnectionError as e:
+                # tried again on first use
+                print(e)
         self.tools = []
         self.available_tools = {}
         self._load_config_into_functions()
@@ -27,8 +55,187 @@ class MCPController:
         self.tool_config = GenerateContentConfig(tools=self.tools)
 
         self.llm_caller = LLMCaller(tools_config=self.tool_config)
+        # the control prompt and the tool declarations are the same on every call, so Vertex keeps them
+        if server_config.get("context_cache", True):
+            self.llm_caller.use_context_cache([Part.from_text(text=server_config["control_prompt"])])
 
 
+    def _create_client(self):
+        """
+        Starts the MCP client selected by the manifest's "client" field, raising ConnectionError
+        if its server does not start.
+
+        "asyncio" runs an AsyncMCPClient on one event loop thread owned by this controller, so
+        several tool calls can be pipelined on the server's stdio at once. Anything else uses
+        the threaded client for the manifest's "io" transport, wrapped in an MCPSupervisor when
+        "supervise" is set.
+        """
+        if self.server_config.get("client") == "asyncio":
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name=f"{self.server_name}-loop", daemon=True).start()
+            client = AsyncMCPClient(self.server_name, self.server_config)
+            self._run(client.engage_mcp_server())
+        elif self.server_config.get("supervise"):
+            # retries the start itself, and raises ConnectionError when it gives up
+            return MCPSupervisor(self.server_name, self.server_config)
+        else:
+            client = create_mcp_client(self.server_name, self.server_config)
+
+        if client.server_info is None:
+            self._close_client(client)
+            raise ConnectionError(f"Server {self.server_name} failed to start")
+        return client
+
+    def _run(self, coro):
+        """Runs a coroutine on the controller's event loop and blocks for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _acquire_client(self):
+        """
+        Returns the running client, starting the server if it is not up yet (lazy or idled out).
+        A failed start raises ConnectionError and is tried again by the next caller.
+        """
+        with self.start_lock:
+            with self.client_lock:
+                if self.mcp_client is not None:
+                    return self._claim_client()
+
+            # client_lock is not held while the server starts, so releases and closes are not held up
+            print(f"Starting {self.server_name} on first use...")
+            client = self._create_client()
+            with self.client_lock:
+                self.mcp_client = client
+                return self._claim_client()
+
+    def _claim_client(self):
+        """Counts a tool call using the client and stops the idle shutdown; called with client_lock held."""
+        self.in_flight += 1
+        if self.idle_timer:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        return self.mcp_client
+
+    def _release_client(self):
+        with self.client_lock:
+            self.in_flight -= 1
+            if self.in_flight == 0 and self.idle_timeout:
+                self.idle_timer = threading.Timer(self.idle_timeout, self._shutdown_if_idle)
+                self.idle_timer.daemon = True
+                self.idle_timer.start()
+
+    def _shutdown_if_idle(self):
+        with self.client_lock:
+            if self.in_flight or self.mcp_client is None:
+                return
+            client, self.mcp_client = self.mcp_client, None
+        print(f"Stopping {self.server_name} after {self.idle_timeout}s without a tool call")
+        self._close_client(client)
+
+    def _close_client(self, client):
+        if self.loop:
+            self._run(client.close())
+        else:
+            client.close()
+
+    def warm_up(self):
+        """Starts the server in the background, so it is ready by the time the model calls a tool."""
+        def start():
+            try:
+                self._acquire_client()
+            except Exception as e:
+                print(f"Error starting {self.server_name}: {e}")
+                return
+            self._release_client()
+
+        threading.Thread(target=start, name=f"{self.server_name}-warm-up", daemon=True).start()
+
+    def close(self):
+        with self.client_lock:
+            if self.idle_timer:
+                self.idle_timer.cancel()
+                self.idle_timer = None
+            client, self.mcp_client = self.mcp_client, None
+        if client:
+            self._close_client(client)
+
+    def call_tool(self, method, arguments):
+        cached = self.result_cache.get(method, arguments)
+        if cached is not None:
+            return cached
+
+        client = self._acquire_client()
+        try:
+            if self.loop:
+                response = self._run(client.send_request(method, arguments))
+            else:
+                response = client.send_request(method, arguments)
+        finally:
+            self._release_client()
+            self.result_cache.called(method)
+        self._cache(method, arguments, response)
+        return response
+
+    def _cache(self, method, arguments, response):
+        if self.result_cache.cacheable(method) and isinstance(response, dict) and response.get("result"):
+            self.result_cache.put(method, arguments, response, self._decode_result(response))
+
+    def call_tools(self, calls):
+        """
+        Executes a list of (method, arguments) calls and returns their responses in the same order.
+
+        Calls with a cached result are answered from the cache. The rest are all in flight together:
+        pipelined on the asyncio client, or sent with send_batch, as one JSON-RPC batch where the
+        server accepts them. A failed call comes back as its exception instead of raising.
+        """
+        responses = [self.result_cache.get(method, arguments) for method, arguments in calls]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if not missing:
+            return responses
+
+        client = self._acquire_client()
+        try:
+            if self.loop:
+                results = self._run(client.send_requests([calls[i] for i in missing]))
+            else:
+                results = client.send_batch([calls[i] for i in missing])
+        finally:
+            self._release_client()
+            for i in missing:
+                self.result_cache.called(calls[i][0])
+
+        for i, response in zip(missing, results):
+            if not isinstance(response, Exception):
+                self._cache(calls[i][0], calls[i][1], response)
+            responses[i] = response
+        return responses
+
+    def _decode_result(self, response):
+        """
+        Returns the payload of a tools/call response: its structuredContent when the server sent
+        one, otherwise its first content block, decoded when it holds JSON text.
+        """
+        result = response["result"]
+        if not result:
+            return result
+
+        if result.get("structuredContent") is not None:
+            structured = result["structuredContent"]
+            # FastMCP wraps results that are not typed objects in {"result": ...}
+            if isinstance(structured, dict) and list(structured) == ["result"]:
+                return structured["result"]
+            return structured
+
+        if not result.get("content"):
+            return result
+        obj = result["content"][0]
+        if obj["type"] == "text":
+            try:
+                return codec.loads(obj["text"])
+            except codec.JSONDecodeError:
+                return obj["text"]
+        return obj
+
     def _load_config_into_functions(self):
 
         function_declarations = []
@@ -41,18 +248,32 @@ class MCPController:
             )
             function_declarations.append(fd)
 
-            self.available_tools[tool["name"]] = (lambda method, arguments: self.mcp_client.send_request(method, arguments))
+            self.available_tools[tool["name"]] = self.call_tool
+
+        # answered by accept_query itself, from the results its history compaction set aside
+        function_declarations.append(RECALL_DECLARATION)
 
-        self.mcp_client.tools = [Tool(function_declarations=function_declarations)]
-        # Also populate self.tools for the tool_config
+        # declarations come from the manifest alone, so they exist before the server is started
         self.tools = [Tool(function_declarations=function_declarations)]
     
 
-    def pull_all_data(self):
+    def _pull_plan(self):
         """
-        Pulls all data from the MCP service.
+        Returns the tool calls that sync this server: the manifest's "pull_plan" if it has one, else
+        the plan generated for this exact manifest entry, asking the model only when there is none.
         """
-
+        if "pull_plan" in self.server_config:
+            return self.server_config["pull_plan"]
+
+        key = manifest_key(self.server_config)
+        plan = plan_cache.get(self.server_name, key)
+        if plan is None:
+            plan = self._generate_pull_plan()
+            plan_cache.put(self.server_name, key, plan)
+            print(f"Stored a new pull plan for {self.server_name}")
+        return plan
+
+    def _generate_pull_plan(self):
         query = f"""
         You are the Sync Strategist for the Aegis AI assistant. Your goal is to generate a plan to keep the user's knowledge graph up-to-date.
         This is done by pulling all data from the {self.server_name} via the tools provided.
@@ -63,6 +284,7 @@ class MCPController:
 
         If relevant, use 'primary' for an ID or 'leon.rode13@gmail.com' for an email address.
         If relevant, start any time range with the current date minus 1 month.
+        {TEMPLATE_HELP}
 
         **Available Tools:**
         {json.dumps(self.server_config["tools"], indent=4)}
@@ -91,55 +313,114 @@ class MCPController:
         if "```json" in text:
             text = text.split("```json")[1].split("```")[0]
 
-        text = json.loads(text)
+        return json.loads(text)
 
-        data = []
+    def iter_pull(self):
+        """
+        Runs this server's pull plan and yields (tool_name, data) as each call completes, detail
+        fetches for the references it returns included (see PlanExecutor).
+
+        The plan is reused across syncs (see pullplans.py); its date templates are filled in here.
+        """
+        plan = [step for step in render(self._pull_plan()) if step["tool_name"] in self.available_tools]
+        executor = PlanExecutor(
+            self.server_config,
+            lambda tool_name, params: self._decode_result(self.call_tool(tool_name, params)),
+            max_concurrency=self.server_config.get("pull_concurrency", 8)
+        )
+
+        for step, result in executor.run(plan):
+            if isinstance(result, Exception):
+                print(f"Error pulling {step['tool_name']}: {result}")
+                continue
+            yield step["tool_name"], result
 
-        for tool in text:
-            response = self.available_tools[tool["tool_name"]](tool["tool_name"], tool["params"])
-            obj = response["result"]
+    def pull_all_data(self):
+        """
+        Pulls all data from the MCP service.
 
-            if response["result"]:
-                obj = response["result"]
-                if "content" in obj:
-                    obj = obj["content"][0]
+        The fields a tool's manifest entry lists in "volatile_fields" (like the current time) are
+        left out, and results come in a fixed order rather than as they complete, so unchanged data
+        pulls the same every time and its graph extraction is answered from the response cache.
+        """
+        volatile = {tool["name"]: set(tool["volatile_fields"]) for tool in self.server_config.get("tools", []) if tool.get("volatile_fields")}
+        results = []
+        for tool_name, data in self.iter_pull():
+            if tool_name in volatile and isinstance(data, dict):
+                data = {key: value for key, value in data.items() if key not in volatile[tool_name]}
+            results.append((tool_name, json.dumps(data, sort_keys=True, default=str), data))
+        return [data for _, _, data in sorted(results, key=lambda result: result[:2])]
 
-                    if obj["type"] == "text":
-                        obj = json.loads(obj["text"])
-            
-            if tool["tool_name"] == "get-events":
-                return obj
 
+    def accept_query(self, query, prompt="control_prompt"):
+        """Answers query, printing the answer as it streams in, and returns the conversation history."""
+        chunks = self.stream_query(query, prompt)
+        answering = False
+        while True:
+            try:
+                text = next(chunks)
+            except StopIteration as done:
+                print()
+                return done.value
 
-            data.append(obj)
+            if not answering:
+                print("\n--- Final Answer from Gemini ---")
+                answering = True
+            print(text, end="", flush=True)
 
-        return data
+    def answer(self, query, prompt="control_prompt"):
+        """Answers query without printing the answer, and returns its text."""
+        return "".join(self.stream_query(query, prompt))
 
+    def stream_query(self, query, prompt="control_prompt"):
+        """
+        Generator version of accept_query: runs the same tool-calling loop, yields the text of the
+        model's answer, and returns the conversation history once the model has answered.
 
-    def accept_query(self, query, prompt="control_prompt"):
+        A turn's text is held until the turn is complete, as text in a turn that also calls tools is
+        the model narrating its next step rather than answering.
+        """
         conversation_history = [Part.from_text(text=self.server_config[prompt]), Part.from_text(text=query)]
+        compactor = HistoryCompactor(self.server_config.get("history_token_budget", 8000))
     
         answered_once = False
         while True:
+            before, after = compactor.compact(conversation_history)
+            if after < before:
+                print(f"History compacted: ~{before} -> ~{after} tokens")
+
             print("\n--- Calling Gemini ---")
             
-            # Make the API call with the current history and available tools
-            response = self.llm_caller.call_llm(
+            # Stream the API call with the current history and available tools, rebuilding the
+            # model's turn from its chunks
+            parts = []
+            usage_metadata = None
+            for chunk in self.llm_caller.stream_llm(
                 prompt="", # prompt is in the conversation_history
                 conversation_history=conversation_history,
-            )
-
-            print(f"Tokens used: {response.usage_metadata.total_token_count}")
+            ):
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.text and not part.function_call:
+                        if parts and parts[-1].text and not parts[-1].function_call:
+                            parts[-1] = Part.from_text(text=parts[-1].text + part.text)
+                            continue
+                    parts.append(part)
 
-            candidate = response.candidates[0]
+            if usage_metadata:
+                cached_tokens = usage_metadata.cached_content_token_count
+                print(f"Tokens used: {usage_metadata.total_token_count}" + (f" ({cached_tokens} of {usage_metadata.prompt_token_count} input tokens from the context cache)" if cached_tokens else ""))
 
             # Check if the model's response contains any function calls
-            parts = candidate.content.parts or []
             has_function_calls = any(getattr(p, "function_call", None) for p in parts)
+            # the model's first turn is only ever followed by another, so it is not the answer
             if not has_function_calls and answered_once:
                 # EXIT CONDITION: The model provided a final text answer
-                print("\n--- Final Answer from Gemini ---")
-                print(response.text)
+                for part in parts:
+                    if part.text:
+                        yield part.text
                 return conversation_history
 
             answered_once = True
@@ -148,37 +429,65 @@ class MCPController:
             print("--- Gemini wants to call a tool ---")
             
             # Append the model's request to the history for the next turn
-            conversation_history.append(candidate.content)
+            conversation_history.append(Content(role="model", parts=parts))
 
             # Prepare a list to hold the results of our tool calls
             function_responses = []
 
-            # Execute all function calls requested by the model in this turn
+            # Collect all function calls requested by the model in this turn, so they go out together.
+            # Each slot keeps its part's position, and holds either the index of its call or the response itself
+            calls = []
+            slots = []
             for part in parts:
                 if not getattr(part, "function_call", None):
                     continue
                 function_call = part.function_call
                 function_name = function_call.name
                 
-                print(f"Executing function: {function_name} with args: {dict(function_call.args)}")
+                print(f"Executing function: {function_name} with args: {dict(function_call.args or {})}")
                 
-                if function_name in self.available_tools:
-                    # Look up the function in our "toolbox" and call it
-                    function_to_call = self.available_tools[function_name]
-                    tool_result = function_to_call(function_name, function_call.args)
-
-                    if "result" in tool_result:
-                        
-                        sliced_tool_result = json.dumps(tool_result["result"]["content"])
-                    else:
-                        sliced_tool_result = tool_result
-                    # Append the result to our list of responses
-                    function_responses.append(Part.from_function_response(
-                        name=function_name,
-                        response={"result": sliced_tool_result}
-                    ))
+                if function_name == RECALL_FUNCTION:
+                    handle = (function_call.args or {}).get("handle")
+                    recalled = compactor.recall(handle)
+                    slots.append((function_name, recalled if recalled is not None else {"error": f"No result with handle '{handle}'."}))
+                elif function_name in self.available_tools:
+                    slots.append((function_name, len(calls)))
+                    calls.append((function_name, dict(function_call.args or {})))
                 else:
                     print(f"Error: Function '{function_name}' not found.")
+                    slots.append((function_name, {"error": f"Function '{function_name}' not found."}))
+
+            started_at = time.monotonic()
+            results = self.call_tools(calls)
+            if calls:
+                print(f"{len(calls)} tool call(s) took {time.monotonic() - started_at:.2f}s")
+
+            for function_name, source in slots:
+                if not isinstance(source, int):
+                    # answered here rather than by the server
+                    function_responses.append(Part.from_function_response(name=function_name, response=source))
+                    continue
+                tool_result = results[source]
+
+                if isinstance(tool_result, Exception):
+                    # e.g. a timed out request, cancelled on the server; let the model decide what to do next
+                    print(f"Error: {tool_result}")
+                    tool_result = {"error": str(tool_result)}
+
+                response = {}
+                if "result" in tool_result:
+                    # hand the model the payload itself rather than JSON text nested in a content block,
+                    # reduced to the fields the manifest's data types keep
+                    sliced_tool_result, dropped = self.projector.project(function_name, self._decode_result(tool_result))
+                    if dropped:
+                        response["omitted_items"] = dropped
+                else:
+                    sliced_tool_result = tool_result
+                response["result"] = sliced_tool_result
+                # Append the result to our list of responses
+                function_responses.append(Part.from_function_response(
+                    name=function_name,
+                    response=response
+                ))
             
             conversation_history.extend(function_responses)
-            time.sleep(2)
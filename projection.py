@@ -0,0 +1,134 @@
+"""
+Projection of tool results down to what the model needs, before they enter a conversation.
+
+Each data type in a server's manifest "data" can list the "fields" worth keeping, with dots for
+nested fields ("attendees.email"). A tool's `returns` schema says where values of each type sit
+in its result; those values keep only their fields. Long strings are cut at "max_field_chars",
+and a result still longer than "result_max_chars" loses items from the end of its longest lists.
+Types without "fields" pass through untouched.
+
+Sizes are estimated at four characters per token.
+"""
+
+import codec
+from resultcache import SCHEMA_TYPES
+
+# the keys of a Google API list response worth keeping around its "items"
+ENVELOPE_FIELDS = ("items", "nextPageToken", "timeZone")
+
+
+def estimate_tokens(value):
+    return len(value if isinstance(value, str) else codec.dumps(value)) // 4
+
+
+def field_tree(fields):
+    """Turns ["start", "attendees.email"] into {"start": {}, "attendees": {"email": {}}}."""
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+class ResultProjector:
+    """Projects the results of one server's tools using the "fields" of its manifest data types."""
+
+    def __init__(self, server_config):
+        self.returns = {tool["name"]: tool.get("returns") for tool in server_config.get("tools", [])}
+        self.fields = {data["name"]: field_tree(data["fields"]) for data in server_config.get("data", []) if data.get("fields")}
+        self.max_field_chars = server_config.get("max_field_chars", 1000)
+        self.result_max_chars = server_config.get("result_max_chars", 12000)
+
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def _cut(self, value):
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[:self.max_field_chars] + f"... [{len(value) - self.max_field_chars} more characters]"
+        if isinstance(value, list):
+            return [self._cut(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._cut(item) for key, item in value.items()}
+        return value
+
+    def _pick(self, value, tree):
+        if not tree:
+            return self._cut(value)
+        if isinstance(value, list):
+            return [self._pick(item, tree) for item in value]
+        if isinstance(value, dict):
+            return {key: self._pick(value[key], subtree) for key, subtree in tree.items() if key in value}
+        return self._cut(value)
+
+    def _project(self, value, schema):
+        if isinstance(schema, str):
+            if schema in self.fields:
+                return self._pick(value, self.fields[schema])
+            return self._cut(value)
+        if not isinstance(schema, dict):
+            return self._cut(value)
+
+        items = schema.get("items")
+        if isinstance(value, list) and items is not None:
+            return [self._project(item, items) for item in value]
+        if isinstance(value, dict) and schema.get("type") == "array" and isinstance(value.get("items"), list):
+            # Google list responses wrap the array in an envelope of etags and paging metadata
+            projected = {key: value[key] for key in ENVELOPE_FIELDS if key in value}
+            projected["items"] = self._project(value["items"], items)
+            return projected
+        if isinstance(value, dict) and "properties" in schema:
+            properties = schema["properties"]
+            return {key: self._project(item, properties[key]) if key in properties else self._cut(item) for key, item in value.items()}
+        if isinstance(value, dict):
+            # {"type": "email_message"}, or {"type": "object", "items": "timezone"} for a single value
+            data_type = schema.get("type") if schema.get("type") not in SCHEMA_TYPES else items
+            return self._project(value, data_type)
+        return self._cut(value)
+
+    def _longest_list(self, value):
+        """Returns the longest list inside value (value itself included), or None."""
+        longest = value if isinstance(value, list) and value else None
+        children = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+        for child in children:
+            found = self._longest_list(child)
+            if found is not None and (longest is None or len(found) > len(longest)):
+                longest = found
+        return longest
+
+    def _cap(self, value):
+        """Drops items from the end of the longest lists until value fits result_max_chars; returns how many."""
+        dropped = 0
+        size = len(codec.dumps(value))
+        while size > self.result_max_chars:
+            longest = self._longest_list(value)
+            if longest is None or len(longest) <= 1:
+                break
+            # assume the list is most of the result, and shrink it by how far the result is over
+            keep = max(1, min(len(longest) - 1, len(longest) * self.result_max_chars // size))
+            dropped += len(longest) - keep
+            del longest[keep:]
+            size = len(codec.dumps(value))
+        return dropped
+
+    def project(self, tool_name, value):
+        """
+        Returns (projected value, number of list items dropped to fit result_max_chars), and
+        prints the estimated token savings of the call.
+        """
+        if tool_name not in self.returns:
+            return value, 0
+
+        projected = self._project(value, self.returns[tool_name])
+        dropped = self._cap(projected)
+
+        before, after = estimate_tokens(value), estimate_tokens(projected)
+        self.calls += 1
+        self.tokens_in += before
+        self.tokens_out += after
+        print(f"Projected {tool_name}: ~{before} -> ~{after} tokens" + (f", {dropped} items dropped" if dropped else ""))
+        return projected, dropped
+
+    def stats(self):
+        return {"calls": self.calls, "tokens_in": self.tokens_in, "tokens_out": self.tokens_out}
@@ -0,0 +1,204 @@
+"""
+Pull plans: the read-only tool calls MCPController.pull_all_data makes to sync a server.
+
+A plan is a list of {"tool_name": ..., "params": {...}}. Plans generated by the model are stored
+on disk, keyed by a hash of the server's manifest entry (its tools and their schemas included),
+and reused until that entry changes, so a steady-state sync makes no planning call.
+
+Parameter values may contain templates, filled in every time the plan runs so a stored plan never
+goes stale: "{{now}}", "{{now - 1 month}}", "{{now + 2 weeks}}", "{{today}}". Units are minutes,
+hours, days, weeks, months and years.
+
+PlanExecutor runs a plan as a DAG: a tool whose manifest `returns` marks values with
+{"is_reference_to": "<data type>"} only hands back ids, and each id is fetched with the tool the
+data type names in its "fetched_by" ({"tool": ..., "id_param": ...}).
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+
+PLAN_CACHE_PATH = os.path.join(".aegis-cache", "pull-plans.json")
+
+TEMPLATE = re.compile(r"\{\{\s*(now|today)\s*(?:([+-])\s*(\d+)\s*(minute|hour|day|week|month|year)s?)?\s*\}\}")
+
+TEMPLATE_HELP = (
+    'Write every date or time parameter as a template, which is filled in when the plan runs: '
+    '"{{now}}" for the current time, "{{now - 1 month}}" for one month ago, "{{today}}" for the '
+    'current date. Units are minutes, hours, days, weeks, months and years.'
+)
+
+
+def manifest_key(server_config):
+    """Hash of a server's manifest entry; a stored plan is only reused while it matches."""
+    return hashlib.sha256(json.dumps(server_config, sort_keys=True).encode()).hexdigest()
+
+
+def render(value, now=None):
+    """Returns value (a plan, or any part of one) with its templates filled in for `now`."""
+    now = now or datetime.now(timezone.utc)
+
+    if isinstance(value, dict):
+        return {key: render(item, now) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item, now) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def fill(match):
+        anchor, sign, amount, unit = match.groups()
+        moment = now
+        if amount:
+            delta = relativedelta(**{f"{unit}s": int(amount)})
+            moment = now + delta if sign == "+" else now - delta
+        if anchor == "today":
+            return moment.strftime("%Y-%m-%d")
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return TEMPLATE.sub(fill, value)
+
+
+class PlanCache:
+    """Generated pull plans, one per server, persisted as JSON at `path`."""
+
+    def __init__(self, path=PLAN_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, server_name, key):
+        """Returns the stored plan for server_name, or None if there is none for this manifest entry."""
+        with self.lock:
+            entry = self._read().get(server_name)
+        if entry and entry.get("key") == key:
+            return entry["plan"]
+        return None
+
+    def put(self, server_name, key, plan):
+        with self.lock:
+            plans = self._read()
+            plans[server_name] = {
+                "key": key,
+                "plan": plan,
+                "created": datetime.now(timezone.utc).isoformat()
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # written aside and swapped in, so no reader or crash sees a half written file
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(plans, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+
+plan_cache = PlanCache()
+
+
+def reference_paths(schema, path=()):
+    """
+    Yields (path, data type) for every {"is_reference_to": ...} in a `returns` schema. A path is a
+    tuple of object keys, with "*" standing for every item of an array.
+    """
+    if not isinstance(schema, dict):
+        return
+    if "is_reference_to" in schema:
+        yield path, schema["is_reference_to"]
+        return
+    for key, child in schema.get("properties", {}).items():
+        yield from reference_paths(child, path + (key,))
+    if "items" in schema:
+        yield from reference_paths(schema["items"], path + ("*",))
+
+
+def ids_at(value, path):
+    """Returns the ids found at path in a tool result; an object found there stands for its "id"."""
+    if not path:
+        if isinstance(value, dict):
+            value = value.get("id")
+        return [value] if isinstance(value, (str, int)) else []
+    key, rest = path[0], path[1:]
+    if key == "*":
+        items = value if isinstance(value, list) else []
+        return [found for item in items for found in ids_at(item, rest)]
+    if isinstance(value, dict) and key in value:
+        return ids_at(value[key], rest)
+    return []
+
+
+class PlanExecutor:
+    """
+    Runs a pull plan, fetching the details of every reference its calls return.
+
+    The plan's own calls start together. As each one completes, its result is yielded and the ids
+    it references are fanned out to their "fetched_by" tool, whose results are yielded (and
+    followed) in turn. At most `max_concurrency` calls are in flight at once, so a sync of N
+    messages costs a few parallel waves rather than N round trips.
+
+    A step of the plan that calls a "fetched_by" tool is not run on its own when another step
+    references that data type; its params become the defaults of each fan-out call instead.
+    """
+
+    def __init__(self, server_config, call, max_concurrency=8):
+        # call(tool_name, params) -> decoded result, raising on failure
+        self.call = call
+        self.max_concurrency = max_concurrency
+        self.tools = {tool["name"]: tool for tool in server_config.get("tools", [])}
+        self.fetchers = {data["name"]: data["fetched_by"] for data in server_config.get("data", []) if "fetched_by" in data}
+        self.references = {
+            name: [(path, data_type) for path, data_type in reference_paths(tool.get("returns")) if data_type in self.fetchers]
+            for name, tool in self.tools.items()
+        }
+
+    def _detail_calls(self, step, result, defaults, seen):
+        """The calls fetching each resource step's result refers to, skipping ids already fetched."""
+        calls = []
+        for path, data_type in self.references.get(step["tool_name"], []):
+            fetcher = self.fetchers[data_type]
+            tool_name = fetcher["tool"]
+            accepted = self.tools.get(tool_name, {}).get("params", {}).get("properties", {})
+            # e.g. the account a listing was made for carries over to fetching its items
+            params = {key: value for key, value in step["params"].items() if key in accepted}
+            params.update(defaults.get(tool_name, {}))
+            for resource_id in ids_at(result, path):
+                if (tool_name, resource_id) in seen:
+                    continue
+                seen.add((tool_name, resource_id))
+                calls.append({"tool_name": tool_name, "params": {**params, fetcher["id_param"]: resource_id}})
+        return calls
+
+    def run(self, plan):
+        """Yields (step, result) as each call completes; result is the exception if the call failed."""
+        referenced = {data_type for step in plan for _, data_type in self.references.get(step["tool_name"], [])}
+        detail_tools = {self.fetchers[data_type]["tool"] for data_type in referenced}
+        defaults = {step["tool_name"]: step["params"] for step in plan if step["tool_name"] in detail_tools}
+        queue = [step for step in plan if step["tool_name"] not in detail_tools]
+        seen = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            running = {}
+            while queue or running:
+                while queue and len(running) < self.max_concurrency:
+                    step = queue.pop(0)
+                    running[executor.submit(self.call, step["tool_name"], step["params"])] = step
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        yield step, e
+                        continue
+                    queue.extend(self._detail_calls(step, result, defaults, seen))
+                    yield step, result
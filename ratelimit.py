@@ -0,0 +1,281 @@
+"""
+Adaptive token buckets for everything that calls a rate limited API.
+
+Buckets are named after the quota they guard, "llm:<model>" for Gemini, "google:<api>" for the
+Google APIs behind the bundled servers and "mcp:<server>" for requests to an MCP server. A call
+takes a token and only waits when its bucket is empty. A 429 or quota error halves the bucket's
+rate and pauses it for the server's Retry-After; every success raises the rate again, a step at a
+time, back to its configured maximum. Transient failures (5xx, dropped connections) are retried
+after an exponential backoff with full jitter, so callers never retry in lockstep.
+
+Limits are read from AEGIS_RATE_LIMITS, a JSON object of bucket name to requests per second or to
+{"rate": ..., "burst": ...}, so servers spawned by Aegis can be given theirs through the
+environment.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+# requests per second for buckets nobody configured, by the part of the name before the colon
+DEFAULT_RATES = {
+    "llm": 10,
+    "google": 10,
+    "mcp": 50,
+}
+
+# error texts that mean "slow down" rather than "not allowed"
+QUOTA_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "RESOURCE_EXHAUSTED", "Too Many Requests")
+
+
+def is_quota_text(text):
+    return any(reason in text for reason in QUOTA_REASONS)
+
+
+# statuses worth retrying as they are: timeouts and server errors
+TRANSIENT_STATUSES = {408, 500, 502, 503, 504}
+
+
+def backoff(attempt, base=0.5, cap=30):
+    """Seconds to wait before retry `attempt` (0 for the first): full jitter over an exponential ceiling."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on quota errors (halving) and recovers on success (additive)."""
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 64
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+        self.calls = 0
+        self.throttled = 0 # calls that had to wait
+        self.waited = 0.0
+        self.quota_errors = 0
+
+    def reserve(self, tokens=1):
+        """Takes tokens, going into debt if there are not enough, and returns how long to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+
+            delay = max(0.0, self.paused_until - now)
+            if self.tokens < 0:
+                delay = max(delay, -self.tokens / self.rate)
+
+            self.calls += 1
+            if delay:
+                self.throttled += 1
+                self.waited += delay
+            return delay
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def penalize(self, retry_after=None):
+        """Called on a 429 or quota error: halves the rate and holds every caller back for retry_after seconds."""
+        with self.lock:
+            self.quota_errors += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = min(self.tokens, 0)
+        print(f"Rate limited on {self.name}, slowing to {self.rate:.2f}/s for the next {pause:.1f}s")
+
+    def succeeded(self):
+        """Called after a successful call: moves the rate back towards its maximum."""
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 2),
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "waited": round(self.waited, 2),
+            "quota_errors": self.quota_errors,
+        }
+
+
+def error_status(error):
+    """Returns (HTTP status or None, response or None) of a google-genai, googleapiclient or httpx error."""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    response = getattr(error, "resp", None) or getattr(error, "response", None)
+    if not isinstance(status, int) and response is not None:
+        status = getattr(response, "status", None) or getattr(response, "status_code", None)
+    return (status if isinstance(status, int) else None), response
+
+
+def is_transient(error):
+    """True for failures a retry may not hit again: 5xx and 408 responses, and dropped or refused connections."""
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    return error_status(error)[0] in TRANSIENT_STATUSES
+
+
+def quota_retry_after(error):
+    """
+    Returns how long to back off for error (None if the server did not say), or False when error
+    is not a rate limit at all.
+
+    Recognizes google-genai errors (code 429 / RESOURCE_EXHAUSTED), googleapiclient HttpErrors
+    (429, or 403 with a rate limit reason) and httpx responses with status 429.
+    """
+    status, response = error_status(error)
+    if status != 429 and not is_quota_text(str(error)):
+        return False
+
+    headers = getattr(response, "headers", response)
+    try:
+        return float(headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Registry of named token buckets, created on first use from the configured or default rates."""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, limits):
+        """Sets limits ({name: rate or {"rate", "burst"}}), replacing the buckets whose limit changed."""
+        with self.lock:
+            for name, limit in limits.items():
+                if self.limits.get(name) != limit:
+                    self.limits[name] = limit
+                    self.buckets.pop(name, None)
+
+    def bucket(self, name):
+        with self.lock:
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                limit = self.limits.get(name, DEFAULT_RATES.get(name.split(":")[0], 10))
+                if not isinstance(limit, dict):
+                    limit = {"rate": limit}
+                bucket = self.buckets[name] = TokenBucket(name, limit["rate"], limit.get("burst"))
+            return bucket
+
+    def _retry_delay(self, bucket, error, attempt, retries, retry_transient=True):
+        """Seconds to wait before retrying a call that failed with error, or None if it should not be retried."""
+        if attempt == retries:
+            return None
+        retry_after = quota_retry_after(error)
+        if retry_after is not False:
+            # the bucket's pause holds back this retry along with every other caller
+            bucket.penalize(retry_after)
+            return 0
+        if retry_transient and is_transient(error):
+            delay = backoff(attempt)
+            print(f"{bucket.name} failed ({error}), retrying in {delay:.1f}s")
+            return delay
+        return None
+
+    def call(self, name, func, retries=3, retry_transient=True):
+        """
+        Calls func once a token is free, retrying it up to `retries` times when it fails on quota or,
+        unless retry_transient is False, transiently. Quota errors are always retried, as the request
+        was refused; a 5xx or dropped connection may come after the request took effect, so calls
+        that are not safe to repeat (sending an email) pass retry_transient=False.
+        """
+        bucket = self.bucket(name)
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                delay = self._retry_delay(bucket, e, attempt, retries, retry_transient)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            bucket.succeeded()
+            return result
+
+    async def call_async(self, name, func, retries=3, deadline=None):
+        """
+        Async version of call, for a func returning an awaitable. With a deadline (a time.monotonic()
+        timestamp), attempts, retries and the waits between them all stop at it with a TimeoutError.
+        """
+        bucket = self.bucket(name)
+
+        def remaining():
+            if deadline is None:
+                return None
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeoutError(f"{name}: deadline exceeded")
+            return left
+
+        for attempt in range(retries + 1):
+            await bucket.acquire_async()
+            timeout = remaining()
+            try:
+                result = await asyncio.wait_for(func(), timeout)
+            except asyncio.TimeoutError:
+                remaining()
+                raise
+            except Exception as e:
+                delay = self._retry_delay(bucket, e, attempt, retries)
+                if delay is None:
+                    raise
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            bucket.succeeded()
+            return result
+
+    def stats(self):
+        with self.lock:
+            return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+limiter = RateLimiter(json.loads(os.getenv("AEGIS_RATE_LIMITS", "{}")))
+
+
+def google_request_builder(api):
+    """
+    Returns a googleapiclient requestBuilder (for discovery.build) whose requests go through the
+    "google:<api>" bucket, so every .execute() of the service is limited and retried on quota.
+    Only GET requests are retried on transient errors, since a write may have gone through.
+    """
+    from googleapiclient.http import HttpRequest
+
+    class RateLimitedRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            return limiter.call(
+                f"google:{api}",
+                lambda: HttpRequest.execute(self, http=http, num_retries=num_retries),
+                retry_transient=self.method == "GET"
+            )
+
+    return RateLimitedRequest
@@ -0,0 +1,139 @@
+"""
+Cache of read-only tool results, for an MCPController.
+
+Only tools whose manifest entry sets "cache_ttl" (seconds) are cached, keyed by tool name and
+canonical arguments. Tools are read-only when their name starts with get, list, search or check
+(as the pull planner assumes), unless "read_only" says otherwise. Once a write tool is called,
+cached results of the tools named in its "invalidates" list are dropped, or, without that list,
+of every cached tool returning one of the same data types (update-event and get-events both
+return calendar_event).
+
+Failures are never cached, whether the server flags them with isError or, as the bundled servers
+do, reports them in a normal result: {"error": ...} or {"success": false, ...}.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# JSON schema types, as opposed to the manifest's own data types like "calendar_event"
+SCHEMA_TYPES = {"object", "array", "string", "number", "integer", "boolean", "null"}
+
+READ_PREFIXES = ("get", "list", "search", "check")
+
+
+def data_types(schema):
+    """Returns the manifest data types named anywhere in a `returns` schema."""
+    if isinstance(schema, str):
+        return set() if schema in SCHEMA_TYPES else {schema}
+    if isinstance(schema, list):
+        return set().union(*(data_types(item) for item in schema))
+    if not isinstance(schema, dict):
+        return set()
+
+    found = set()
+    for key in ("type", "items", "is_reference_to"):
+        found |= data_types(schema.get(key))
+    for child in schema.get("properties", {}).values():
+        found |= data_types(child)
+    return found
+
+
+def is_error_payload(payload):
+    """True for a decoded tool result that reports a failure rather than data."""
+    return isinstance(payload, dict) and ("error" in payload or payload.get("success") is False)
+
+
+def is_read_only(tool):
+    if "read_only" in tool:
+        return tool["read_only"]
+    return tool["name"].replace("-", "_").split("_")[0] in READ_PREFIXES
+
+
+class ToolResultCache:
+    """LRU cache of tool responses with per-tool TTLs from the manifest, and hit/miss counters."""
+
+    def __init__(self, tools, max_entries=256):
+        self.max_entries = max_entries
+        self.ttls = {tool["name"]: tool["cache_ttl"] for tool in tools if tool.get("cache_ttl")}
+
+        # write tool -> cacheable tools whose results it makes stale
+        returned = {tool["name"]: data_types(tool.get("returns")) for tool in tools}
+        self.invalidates = {}
+        for tool in tools:
+            name = tool["name"]
+            if name in self.ttls or is_read_only(tool):
+                continue
+            if "invalidates" in tool:
+                self.invalidates[name] = set(tool["invalidates"]) & set(self.ttls)
+            else:
+                self.invalidates[name] = {cached for cached in self.ttls if returned[cached] & returned[name]}
+
+        # (tool name, canonical arguments) -> (expires at, response), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, tool_name, arguments):
+        return tool_name, json.dumps(arguments, sort_keys=True, default=str)
+
+    def get(self, tool_name, arguments):
+        """Returns the cached response for this call, or None."""
+        if tool_name not in self.ttls:
+            return None
+        key = self._key(tool_name, arguments)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def cacheable(self, tool_name):
+        return tool_name in self.ttls
+
+    def put(self, tool_name, arguments, response, payload=None):
+        """
+        Stores a successful response of a cacheable tool; errors are never cached. payload is the
+        decoded result, checked for failures reported as data.
+        """
+        if tool_name not in self.ttls or not isinstance(response, dict):
+            return
+        result = response.get("result")
+        if not isinstance(result, dict) or result.get("isError") or is_error_payload(payload):
+            return
+        key = self._key(tool_name, arguments)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttls[tool_name], response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def called(self, tool_name):
+        """Drops the results a call to tool_name may have made stale."""
+        stale = self.invalidates.get(tool_name)
+        if not stale:
+            return
+        with self.lock:
+            for key in [key for key in self.entries if key[0] in stale]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
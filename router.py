@@ -0,0 +1,202 @@
+"""
+Local query routing for the Sorter, so most queries pick their service without a model call.
+
+Each service is described by a TF-IDF vector of its name, tool names and descriptions, data types
+and their purposes, plus the "routing_keywords" its manifest entry lists. A query goes to the
+most similar service when that service clearly beats the runner-up; otherwise route returns None
+and the Sorter asks the model. route_many also sends a read-only query to several services when it
+uses each one's own routing keywords and either every one of them scores close to the best, or the
+query asks about one service's data in terms of another's ("emails about tomorrow's meetings").
+
+Evaluate it offline against a labeled file, one {"query": ..., "service": ...} per line, where
+"service" may be a list for queries that need several services:
+
+    python router.py router-eval.jsonl
+"""
+
+import json
+import math
+import re
+import sys
+import time
+from collections import Counter
+
+from resultcache import is_read_only
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "from", "with", "by", "at", "is",
+    "are", "was", "be", "it", "its", "this", "that", "my", "me", "i", "you", "your", "do", "does",
+    "have", "has", "any", "what", "whats", "which", "who", "how", "can", "get", "list", "about",
+    "all", "there", "if", "as", "not", "no", "into", "use", "user",
+}
+
+# keywords count this many times over in a service's description, as they are chosen for routing
+KEYWORD_WEIGHT = 3
+
+# words about time, which fit a query for any service, so they never send a query to a second one
+GENERIC_KEYWORDS = {
+    "today", "tomorrow", "yesterday", "tonight", "morning", "afternoon", "evening", "week", "weekend",
+    "month", "year", "time", "date", "day", "free", "now", "recent", "latest", "new", "last", "next",
+}
+
+# verbs of actions that change something; a query doing one is never sent to several services
+WRITE_VERBS = {
+    "send", "create", "add", "update", "delete", "cancel", "move", "reschedule", "reply", "forward",
+    "remove", "invite", "archive", "rsvp", "edit", "change",
+}
+
+# a query asking for one service's data about another's: "emails about my meetings"
+MULTI_INTENT = re.compile(r"\b(about|regarding|related to|relating to|mention(s|ed|ing)?|concerning)\b")
+
+# share of the best service's score every service of a fan-out needs, without a MULTI_INTENT match
+FAN_OUT_SHARE = 0.5
+
+
+def tokenize(text):
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        # a single letter is the "s" of "tomorrow's", and says nothing about a service
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        # a light stemmer: "emails" and "email", "meetings" and "meeting" match
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def describe(server_name, server_config):
+    """The text a service is matched on."""
+    words = [server_name]
+    for tool in server_config.get("tools", []):
+        words += [tool["name"].replace("-", " ").replace("_", " "), tool.get("description", "")]
+    for data in server_config.get("data", []):
+        words += [data["name"].replace("_", " "), data.get("description", "")]
+        words += [purpose.replace("_", " ") for purpose in data.get("purpose", [])]
+    words += server_config.get("routing_keywords", []) * KEYWORD_WEIGHT
+    return " ".join(words)
+
+
+class QueryRouter:
+    """TF-IDF router over the services of a manifest."""
+
+    def __init__(self, servers, threshold=0.25):
+        # minimum lead of the best service over the runner-up, relative to the best score
+        self.threshold = threshold
+        documents = {name: Counter(tokenize(describe(name, config))) for name, config in servers.items()}
+
+        document_frequency = Counter(token for counts in documents.values() for token in counts)
+        count = len(documents)
+        self.idf = {token: math.log((1 + count) / (1 + df)) + 1 for token, df in document_frequency.items()}
+        self.vectors = {name: self._vector(counts) for name, counts in documents.items()}
+        # routing keywords of one service only, which are evidence for that service on their own
+        keywords = {name: set(tokenize(" ".join(config.get("routing_keywords", [])))) - GENERIC_KEYWORDS for name, config in servers.items()}
+        self.owned = {
+            name: {token for token in tokens if not any(token in keywords[other] for other in keywords if other != name)}
+            for name, tokens in keywords.items()
+        }
+        # the verbs of the manifest's write tools ("send_gmail", "delete-event") join WRITE_VERBS
+        self.write_verbs = set(WRITE_VERBS)
+        for config in servers.values():
+            for tool in config.get("tools", []):
+                if not is_read_only(tool):
+                    self.write_verbs.add(tool["name"].replace("-", "_").split("_")[0])
+
+    def _vector(self, counts):
+        vector = {token: (1 + math.log(n)) * self.idf[token] for token, n in counts.items() if token in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1
+        return {token: weight / norm for token, weight in vector.items()}
+
+    def scores(self, query):
+        """Cosine similarity of query to every service, best first."""
+        vector = self._vector(Counter(tokenize(query)))
+        scores = {
+            name: sum(weight * service.get(token, 0) for token, weight in vector.items())
+            for name, service in self.vectors.items()
+        }
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def route(self, query):
+        """Returns (service name or None when not confident enough, confidence)."""
+        scores = self.scores(query)
+        if not scores or scores[0][1] <= 0:
+            return None, 0.0
+
+        best, best_score = scores[0]
+        runner_up = scores[1][1] if len(scores) > 1 else 0
+        confidence = (best_score - runner_up) / best_score
+        if confidence < self.threshold:
+            return None, confidence
+        return best, confidence
+
+    def is_write(self, query):
+        """True when query asks for an action that changes something, like sending an email."""
+        return bool(set(tokenize(query)) & self.write_verbs)
+
+    def route_many(self, query):
+        """
+        Returns (service names or None, confidence) like route, but routes a read-only query using the
+        own routing keywords of several services to all of them, when each scores at least
+        FAN_OUT_SHARE of the best or the query matches MULTI_INTENT. The confidence of a fan-out is
+        the score of its weakest service relative to the best. A write using the own keywords of
+        several services is left to the LLM, which orders them.
+        """
+        tokens = set(tokenize(query))
+        scores = self.scores(query)
+        services = [(name, score) for name, score in scores if score > 0 and tokens & self.owned[name]]
+        if len(services) > 1:
+            if self.is_write(query):
+                # a write with a read half on another service needs both, in order: left to the LLM
+                return None, services[-1][1] / scores[0][1]
+            share = services[-1][1] / scores[0][1]
+            if share >= FAN_OUT_SHARE or MULTI_INTENT.search(query.lower()):
+                return [name for name, _ in services], share
+
+        service_name, confidence = self.route(query)
+        return ([service_name] if service_name else None), confidence
+
+
+def evaluate(router, path):
+    """Routes every labeled query in path and reports accuracy and latency."""
+    with open(path, "r") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    top_correct = confident = confident_correct = 0
+    latencies = []
+    for example in examples:
+        expected = example["service"] if isinstance(example["service"], list) else [example["service"]]
+
+        started_at = time.perf_counter()
+        services, _ = router.route_many(example["query"])
+        latencies.append(time.perf_counter() - started_at)
+
+        best = router.scores(example["query"])[0][0]
+        top_correct += best in expected
+        if services is not None:
+            confident += 1
+            correct = set(services) == set(expected)
+            confident_correct += correct
+            if not correct:
+                print(f"  misrouted: {example['query']!r} to {services}, expected {expected}")
+        else:
+            print(f"  falls back to the LLM: {example['query']!r} (best guess {best})")
+
+    latencies.sort()
+    total = len(examples) or 1
+    print(f"Queries: {len(examples)}")
+    print(f"Top-1 accuracy: {top_correct / total:.1%}")
+    print(f"Routed locally: {confident / total:.1%}, of which correct: {confident_correct / (confident or 1):.1%}")
+    print(f"Sent to the LLM: {len(examples) - confident}")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Latency: mean {sum(latencies) / len(latencies) * 1000:.3f}ms, p95 {p95 * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python router.py <labeled queries .jsonl>")
+        sys.exit(1)
+
+    with open("aegis-manifest.json", "r") as f:
+        manifest = json.load(f)
+    evaluate(QueryRouter(manifest.get("servers", {}), manifest.get("routing_threshold", 0.25)), sys.argv[1])
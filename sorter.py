@@ -1,6 +1,13 @@
 from mcpcontroller import MCPController
+import codec
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextcache import context_cache
+from llmcache import response_cache
 from llmcaller import LLMCaller
+from ratelimit import limiter
+from router import QueryRouter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +18,8 @@ class Sorter:
     def __init__(self):
         # service name -> MCPClient
         self.mcp_controllers = {}
+        # service name -> seconds it took to start and initialize
+        self.startup_times = {}
         self._load_services_as_controllers()
         self.llm_caller = LLMCaller()
 
@@ -18,23 +27,88 @@ class Sorter:
         with open("aegis-manifest.json", "r") as f:
             manifest = json.load(f)
 
-            for service_name, server_config in manifest.get("servers", {}).items():
-                self.mcp_controllers[service_name] = MCPController(service_name, server_config)
+        # e.g. {"llm:gemini-2.0-flash-lite-001": 5}, see ratelimit.py
+        limiter.configure(manifest.get("rate_limits", {}))
+        response_cache.configure(manifest.get("llm_cache_size", response_cache.max_entries))
+        context_cache.configure(manifest.get("context_cache_ttl", context_cache.ttl))
+
+        servers = manifest.get("servers", {})
+        # how many services pull_all_data syncs at once
+        self.sync_concurrency = max(1, manifest.get("sync_concurrency", len(servers) or 1))
+        # built from the manifest alone, the router needs no running server
+        self.router = QueryRouter(servers, manifest.get("routing_threshold", 0.25))
+        if not servers:
+            return
+
+        def start_controller(service_name, server_config):
+            started_at = time.monotonic()
+            # lazy servers only get their tool declarations now, the process starts on first use
+            lazy = server_config.get("lazy", manifest.get("lazy", False))
+            controller = MCPController(service_name, server_config, lazy=lazy)
+            return controller, time.monotonic() - started_at
+
+        # every server is launched at once, so startup costs the slowest server rather than the sum
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+            futures = {
+                service_name: executor.submit(start_controller, service_name, server_config)
+                for service_name, server_config in servers.items()
+            }
+            for service_name, future in futures.items():
+                try:
+                    controller, startup_time = future.result()
+                except Exception as e:
+                    print(f"Error starting service {service_name}: {e}")
+                    continue
+                self.mcp_controllers[service_name] = controller
+                self.startup_times[service_name] = startup_time
+
+        for service_name, startup_time in self.startup_times.items():
+            print(f"{service_name} started in {startup_time:.2f}s")
+        print(f"All services started in {time.monotonic() - started_at:.2f}s")
 
         
 
     def pull_all_data(self):
-        data = {}
-        for service_name in self.mcp_controllers:
-            data[service_name] = self.mcp_controllers[service_name].pull_all_data()
+        """
+        Pulls every service's data concurrently, at most `sync_concurrency` services at once, and
+        returns {service name: list of tool results}. Services that fail to pull are left out.
+        """
+        def pull(service_name):
+            started_at = time.monotonic()
+            results = self.mcp_controllers[service_name].pull_all_data()
+            return results, time.monotonic() - started_at
 
-        print("DATA PULLED")
-        print(data)
+        data = {}
+        if not self.mcp_controllers:
+            return data
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.sync_concurrency, len(self.mcp_controllers))) as executor:
+            futures = {service_name: executor.submit(pull, service_name) for service_name in self.mcp_controllers}
+            for service_name, future in futures.items():
+                try:
+                    results, pull_time = future.result()
+                except Exception as e:
+                    print(f"Error pulling {service_name}: {e}")
+                    continue
+                data[service_name] = results
+                print(f"{service_name}: pulled {len(results)} results ({len(codec.dumps(results)) // 1024} KB) in {pull_time:.2f}s")
+
+        print(f"DATA PULLED from {len(data)} of {len(self.mcp_controllers)} services in {time.monotonic() - started_at:.2f}s")
 
         return data
 
-    def accept_query(self, query):
-        """Decides which MCP client to use to answer the query, and fowards the query to the appropriate MCP client"""
+    def _route(self, query):
+        """
+        Returns the names of the services to answer query, usually one: from the local router when
+        it is confident, else from the LLM.
+        """
+        started_at = time.monotonic()
+        service_names, confidence = self.router.route_many(query)
+        if service_names is not None:
+            print(f"Routed to {', '.join(service_names)} locally (confidence {confidence:.2f}) in {(time.monotonic() - started_at) * 1000:.2f}ms")
+            return service_names
 
         # create LLM conversation with information about all the MCP servers
         # we can use
@@ -44,25 +118,101 @@ class Sorter:
         The tools you have access to are:
         {json.dumps(list(self.mcp_controllers.keys()), indent=4)}
 
-        Your job is to understand the user's query, and determine which service is best suited to answer the query.
-        Your job is NOT to answer the query, only to determine the right service to use to answer the query.
+        Your job is to understand the user's query, and determine which services are best suited to answer the query.
+        Your job is NOT to answer the query, only to determine the right services to use to answer the query.
 
-        Your output should only be the name of the service derived from the JSON above.
+        Your output should only be a JSON array of service names derived from the JSON above, without any formatting.
+        Usually that is a single service; only list several if the query needs data from each of them.
+        When the query asks for an action that needs data from another service, list the services in the
+        order they should run, the one taking the action last.
 
         The user's query is: {query}
         """
 
-        response = self.llm_caller.call_llm(prompt)
-
-        service_name = response.text.strip()
-        if service_name in self.mcp_controllers:
-            return self.mcp_controllers[service_name].accept_query(query)
-        else:
-            return f"Error: Service {service_name} not found"
-
-
+        response = self.llm_caller.call_llm(prompt, cache=True)
+
+        text = response.text.strip()
+        if "```json" in text:
+            text = text.split("```json")[1].split("```")[0]
+        text = text.strip("`").strip()
+        try:
+            service_names = json.loads(text)
+        except json.JSONDecodeError:
+            service_names = text
+        if not isinstance(service_names, list):
+            service_names = [str(service_names)]
+        print(f"Routed to {', '.join(service_names)} by the LLM (local confidence {confidence:.2f}) in {time.monotonic() - started_at:.2f}s")
+        return service_names
+
+    def _merge_answers(self, query, answers):
+        """Prints and returns one answer to query from the answers of several services, streamed as it is generated."""
+        prompt = f"""
+        You are a helpful assistant. Several services each answered the user's query from their own data.
+        Combine their answers into one answer to the query. Do not mention the services.
 
+        The services' answers are:
+        {json.dumps(answers, indent=4)}
 
+        The user's query is: {query}
+        """
 
+        print("\n--- Final Answer from Gemini ---")
+        text = ""
+        for chunk in self.llm_caller.stream_llm(prompt):
+            print(chunk.text or "", end="", flush=True)
+            text += chunk.text or ""
+        print()
+        return text
 
+    def _chain(self, query, service_names):
+        """
+        Answers a query asking for an action with several services in turn, in the LLM's order, each
+        given the answers before it, so the one taking the action has the data it needs.
+        """
+        answers = {}
+        for service_name in service_names:
+            started_at = time.monotonic()
+            prompt = query
+            if answers:
+                prompt = f"{query}\n\nWhat other services found so far:\n{json.dumps(answers, indent=4)}"
+            try:
+                answers[service_name] = self.mcp_controllers[service_name].answer(prompt)
+            except Exception as e:
+                answers[service_name] = f"Error: {e}"
+            print(f"{service_name} answered in {time.monotonic() - started_at:.2f}s")
+
+        return self._merge_answers(query, answers)
 
+    def accept_query(self, query):
+        """Decides which MCP clients to use to answer the query, and fowards the query to the appropriate MCP clients"""
+
+        routed = self._route(query)
+        service_names = [name for name in routed if name in self.mcp_controllers]
+        if not service_names:
+            return f"Error: Service {', '.join(routed)} not found"
+
+        # lazy servers start while the model plans their first tool call
+        for service_name in service_names:
+            self.mcp_controllers[service_name].warm_up()
+
+        if len(service_names) == 1:
+            return self.mcp_controllers[service_names[0]].accept_query(query)
+
+        if self.router.is_write(query):
+            return self._chain(query, service_names)
+
+        def answer(service_name):
+            started_at = time.monotonic()
+            try:
+                text = self.mcp_controllers[service_name].answer(query)
+            except Exception as e:
+                text = f"Error: {e}"
+            print(f"{service_name} answered in {time.monotonic() - started_at:.2f}s")
+            return text
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(service_names)) as executor:
+            answers = dict(zip(service_names, executor.map(answer, service_names)))
+        print(f"{len(service_names)} services answered in {time.monotonic() - started_at:.2f}s")
+
+        return self._merge_answers(query, answers)
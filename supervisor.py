@@ -0,0 +1,204 @@
+"""
+Keeps MCP servers alive behind an MCPClient-compatible interface.
+"""
+
+import random
+import threading
+import time
+
+from client import create_mcp_client
+
+
+class MCPSupervisor:
+    """
+    Supervises the MCPClient of one server, over whichever transport its "io" field names.
+
+    A background thread checks every `ping_interval` seconds that the process is still running
+    and answers an MCP ping. A dead process, or `max_ping_failures` pings in a row without an
+    answer, restarts the server with exponential backoff; starting a new MCPClient replays the
+    initialize handshake.
+
+    With `warm_spare` enabled a second, already initialized client is kept on standby, so a
+    failover is a swap instead of a full server start (Python imports plus Google auth).
+
+    Starting the server at construction or on a restart gives up after `max_start_attempts`
+    and raises ConnectionError; the next request tries again. Only the spare keeps retrying, in
+    the background.
+
+    Exposes send_request like MCPClient, so an MCPController can use either.
+    """
+
+    def __init__(self, server_name, server_config):
+        self.server_name = server_name
+        self.server_config = server_config
+
+        options = server_config.get("supervise", {})
+        if not isinstance(options, dict):
+            options = {}
+        self.ping_interval = options.get("ping_interval", 30)
+        self.ping_timeout = options.get("ping_timeout", 5)
+        self.max_ping_failures = options.get("max_ping_failures", 2)
+        self.backoff_base = options.get("backoff_base", 1)
+        self.backoff_max = options.get("backoff_max", 60)
+        self.warm_spare = options.get("warm_spare", False)
+        self.max_start_attempts = options.get("max_start_attempts", 3)
+
+        self.lock = threading.Lock()
+        self.restart_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.restarts = 0
+        self.ping_failures = 0
+        self.tools = []
+
+        self.spare = None
+        self.client = self._start_client(self.max_start_attempts)
+        if self.warm_spare:
+            self._start_spare()
+
+        self.monitor = threading.Thread(target=self._monitor, name=f"{server_name}-supervisor", daemon=True)
+        self.monitor.start()
+
+    @property
+    def messages(self):
+        return self.client.messages
+
+    @property
+    def stderr_logs(self):
+        return self.client.stderr_logs
+
+    def _start_client(self, max_attempts=None):
+        """
+        Starts a server, retrying with exponential backoff and jitter until it initializes. After
+        max_attempts failed starts (None for no limit) it raises ConnectionError.
+        """
+        attempt = 0
+        while not self.stopped.is_set():
+            client = create_mcp_client(self.server_name, self.server_config)
+            if client.server_info is not None:
+                return client
+
+            client.close()
+            if max_attempts is not None and attempt + 1 >= max_attempts:
+                raise ConnectionError(f"Server {self.server_name} failed to start after {max_attempts} attempts")
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            print(f"Server {self.server_name} failed to start, retrying in {delay:.1f}s")
+            self.stopped.wait(delay)
+            attempt += 1
+
+        return None
+
+    def _start_spare(self):
+        def start():
+            spare = self._start_client()
+            with self.lock:
+                if self.spare is None and not self.stopped.is_set():
+                    self.spare = spare
+                    return
+            if spare:
+                spare.close()
+
+        threading.Thread(target=start, name=f"{self.server_name}-spare", daemon=True).start()
+
+    def _healthy(self, client):
+        return client is not None and client.is_alive()
+
+    def restart(self, reason, failed=None):
+        """
+        Replaces the current client, promoting the warm spare when one is ready.
+
+        `failed` is the client the caller saw misbehave; if another thread already replaced it,
+        nothing is restarted twice.
+        """
+        with self.restart_lock:
+            with self.lock:
+                if failed is not None and self.client is not failed:
+                    return
+                failed = self.client
+                spare, self.spare = self.spare, None
+
+            print(f"Restarting server {self.server_name}: {reason}")
+            started_at = time.monotonic()
+            if self._healthy(spare):
+                client = spare
+            else:
+                if spare:
+                    spare.close()
+                # a hung server can hold on to resources the replacement needs, so it goes first
+                if failed:
+                    failed.close()
+                try:
+                    client = self._start_client(self.max_start_attempts)
+                except ConnectionError:
+                    # no client until the next request or check restarts it again
+                    with self.lock:
+                        self.client = None
+                    raise
+
+            with self.lock:
+                self.client = client
+                self.restarts += 1
+                self.ping_failures = 0
+            print(f"Server {self.server_name} replaced in {time.monotonic() - started_at:.2f}s")
+
+            # with a spare in place new requests are already being served while the old one shuts down
+            if failed and failed.is_alive():
+                failed.close()
+
+        if self.warm_spare:
+            self._start_spare()
+
+    def _monitor(self):
+        while not self.stopped.wait(self.ping_interval):
+            with self.lock:
+                spare = self.spare
+                if spare is not None and not spare.is_alive():
+                    self.spare = None
+            if spare is not None and not spare.is_alive():
+                spare.close()
+                self._start_spare()
+
+            client = self.client
+            if not self._healthy(client):
+                try:
+                    self.restart("process exited", client)
+                except ConnectionError as e:
+                    print(e)
+                continue
+
+            if client.ping(self.ping_timeout):
+                self.ping_failures = 0
+                continue
+
+            self.ping_failures += 1
+            print(f"Server {self.server_name} missed ping {self.ping_failures}/{self.max_ping_failures}")
+            if self.ping_failures >= self.max_ping_failures:
+                try:
+                    self.restart("not answering pings", client)
+                except ConnectionError as e:
+                    print(e)
+
+    def send_request(self, method, arguments, timeout=None):
+        # a request is only re-routed if the server was already gone before it was sent,
+        # tool calls are not assumed to be safe to repeat
+        client = self.client
+        if not self._healthy(client):
+            self.restart("process exited", client)
+            client = self.client
+        return client.send_request(method, arguments, timeout)
+
+    def send_batch(self, calls, timeout=None):
+        client = self.client
+        if not self._healthy(client):
+            self.restart("process exited", client)
+            client = self.client
+        return client.send_batch(calls, timeout)
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            clients = [self.client, self.spare]
+            self.client = self.spare = None
+        for client in clients:
+            if client:
+                client.close()
@@ -0,0 +1,60 @@
+"""
+A scripted MCP server on stdio, for the client tests.
+
+Its one tool, "echo", answers {"echo": ..., "cancelled": [...]} after `delay` seconds, so tests
+can make responses arrive out of order, or too late. The first argument picks how JSON-RPC batches
+are handled: "batch" answers them, "reject" answers with an error without an id, as a server that
+cannot parse them does, and "drop" ignores them.
+"""
+
+import json
+import sys
+import threading
+
+batch_mode = sys.argv[1] if len(sys.argv) > 1 else "batch"
+write_lock = threading.Lock()
+# ids of the requests the client cancelled
+cancelled = []
+
+
+def write(message):
+    with write_lock:
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+
+def answer(message):
+    """Returns the response to a request, or None when it is a notification or answered later."""
+    method = message.get("method")
+    if method == "notifications/cancelled":
+        cancelled.append(message["params"]["requestId"])
+    if "id" not in message:
+        return None
+
+    if method == "initialize":
+        return {"jsonrpc": "2.0", "id": message["id"], "result": {"serverInfo": {"name": "fake"}}}
+    if method == "ping":
+        return {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+
+    arguments = message["params"]["arguments"]
+    response = {
+        "jsonrpc": "2.0",
+        "id": message["id"],
+        "result": {"content": [{"type": "text", "text": json.dumps({"echo": arguments.get("echo"), "cancelled": cancelled})}]}
+    }
+    if arguments.get("delay"):
+        threading.Timer(arguments["delay"], write, args=(response,)).start()
+        return None
+    return response
+
+
+for line in sys.stdin:
+    message = json.loads(line)
+    if not isinstance(message, list):
+        response = answer(message)
+        if response is not None:
+            write(response)
+    elif batch_mode == "batch":
+        write([response for response in map(answer, message) if response is not None])
+    elif batch_mode == "reject":
+        write({"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}})
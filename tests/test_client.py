@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from client import AsyncMCPClient, MCPClient
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_server.py")
+
+
+def server_config(batch_mode="batch", **options):
+    return {"startup": [sys.executable, FAKE_SERVER, batch_mode], "cwd": "", **options}
+
+
+def payload(response):
+    return json.loads(response["result"]["content"][0]["text"])
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(batch_mode="batch", **options):
+        client = MCPClient("fake", server_config(batch_mode, **options))
+        clients.append(client)
+        assert client.server_info is not None
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_responses_are_matched_to_requests_by_id(make_client):
+    client = make_client()
+
+    # the first call is answered last
+    responses = client.send_batch([("echo", {"echo": "slow", "delay": 0.3}), ("echo", {"echo": "fast"})])
+
+    assert [payload(response)["echo"] for response in responses] == ["slow", "fast"]
+    assert client.pending == {}
+
+
+def test_timed_out_request_is_cancelled_and_its_late_response_dropped(make_client):
+    client = make_client()
+    request_id = client.req_id
+
+    with pytest.raises(TimeoutError):
+        client.send_request("echo", {"echo": "late", "delay": 0.5}, timeout=0.1)
+    time.sleep(0.7)
+
+    assert client.pending == {}
+    assert len(client.messages) == 0
+    # the server was told, before the next request
+    assert request_id in payload(client.send_request("echo", {"echo": "next"}))["cancelled"]
+
+
+def test_tool_timeout_comes_from_the_manifest(make_client):
+    client = make_client(tools=[{"name": "echo", "timeout": 0.1}])
+
+    started_at = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.send_request("echo", {"echo": "late", "delay": 1})
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_batch_is_sent_once_the_server_answers_one(make_client):
+    client = make_client(batch=True)
+
+    responses = client.send_batch([("echo", {"echo": "a"}), ("echo", {"echo": "b"})])
+
+    assert client.batch_supported is True
+    assert [payload(response)["echo"] for response in responses] == ["a", "b"]
+
+
+@pytest.mark.parametrize("batch_mode", ["reject", "drop"])
+def test_batch_falls_back_to_single_requests(make_client, batch_mode):
+    client = make_client(batch_mode, batch=True, batch_probe_timeout=0.3)
+
+    responses = client.send_batch([("echo", {"echo": "a"}), ("echo", {"echo": "b"})])
+
+    assert client.batch_supported is False
+    assert [payload(response)["echo"] for response in responses] == ["a", "b"]
+
+
+def test_ping_and_close(make_client):
+    client = make_client()
+
+    assert client.ping()
+    client.close()
+    assert not client.is_alive()
+    assert not client.ping(timeout=0.2)
+
+
+def test_async_client_pipelines_requests():
+    async def run():
+        client = AsyncMCPClient("fake-async", server_config())
+        assert await client.engage_mcp_server()
+        try:
+            responses = await client.send_requests([("echo", {"echo": "slow", "delay": 0.3}), ("echo", {"echo": "fast"})])
+            assert [payload(response)["echo"] for response in responses] == ["slow", "fast"]
+            assert await client.ping()
+
+            with pytest.raises(TimeoutError):
+                await client.send_request("echo", {"echo": "late", "delay": 0.3}, timeout=0.1)
+            await asyncio.sleep(0.5)
+            assert client.pending == {}
+            assert len(client.messages) == 0
+        finally:
+            await client.close()
+        assert not client.is_alive()
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+from google.genai.types import Content, Part
+
+from compaction import HistoryCompactor, summarize
+
+
+def events(count):
+    return {"result": {"items": [{"summary": f"Event {i}", "description": "x" * 200} for i in range(count)]}}
+
+
+def conversation(*responses, answered=True):
+    """A prompt, a query, and one function call and response per entry of responses, each answered by a model turn."""
+    history = [Part.from_text(text="You plan tool calls."), Part.from_text(text="What is on this week?")]
+    for response in responses:
+        history.append(Content(role="model", parts=[Part.from_function_call(name="get-events", args={})]))
+        history.append(Part.from_function_response(name="get-events", response=response))
+    if answered:
+        history.append(Content(role="model", parts=[Part.from_text(text="Done.")]))
+    return history
+
+
+def test_summarize_names_records():
+    assert summarize({"summary": "Standup"}) == "Standup"
+    assert summarize([{"subject": "Hi"}, {"subject": "Bye"}]) == "2 items (Hi, Bye)"
+    assert summarize(list(range(7)), limit=2) == "7 items (0, 1 and 5 more)"
+    assert summarize({"items": [{"id": "a"}]}) == "items: 1 items (a)"
+
+
+def test_history_under_budget_is_left_alone():
+    history = conversation(events(2))
+    original = list(history)
+
+    before, after = HistoryCompactor(budget=100000).compact(history)
+
+    assert before == after
+    assert history == original
+
+
+def test_answered_responses_become_handles_oldest_first():
+    first, second = events(30), events(30)
+    history = conversation(first, second)
+    compactor = HistoryCompactor(budget=1)
+
+    before, after = compactor.compact(history)
+
+    assert after < before
+    compacted = [history[3].function_response, history[5].function_response]
+    assert [response.name for response in compacted] == ["get-events", "get-events"]
+    assert compacted[0].response["handle"] == "get-events#1"
+    assert compacted[1].response["handle"] == "get-events#2"
+    assert compacted[0].response["summary"].startswith("items: 30 items (Event 0, ")
+    # the handle gives back the full result
+    assert compactor.recall("get-events#1") == first
+    assert compactor.recall("get-events#2") == second
+    assert compactor.recall("get-events#3") is None
+
+
+def test_prompt_query_and_unanswered_responses_are_kept():
+    history = conversation(events(30), events(30), answered=False)
+    prompt, query, latest = history[0], history[1], history[-1]
+
+    HistoryCompactor(budget=1).compact(history)
+
+    assert history[0] is prompt
+    assert history[1] is query
+    # the model has not seen the latest response yet
+    assert history[-1] is latest
+    assert "handle" in history[3].function_response.response
+
+
+def test_compaction_stops_once_under_budget():
+    history = conversation(events(30), events(30))
+    compactor = HistoryCompactor()
+    full, _ = compactor.compact(list(history))
+    # room for everything but part of one response
+    compactor.budget = full - 100
+
+    compactor.compact(history)
+
+    assert "handle" in history[3].function_response.response
+    assert "handle" not in history[5].function_response.response
+
+
+def test_compacted_responses_are_not_compacted_again():
+    history = conversation(events(30))
+    compactor = HistoryCompactor(budget=1)
+
+    compactor.compact(history)
+    compactor.compact(history)
+
+    assert list(compactor.archive) == ["get-events#1"]
@@ -0,0 +1,128 @@
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+from google.genai.types import Candidate, Content, GenerateContentResponse, Part
+
+from llmcache import ResponseCache, SingleFlight, cache_key
+
+
+def response(text):
+    return GenerateContentResponse(candidates=[Candidate(content=Content(role="model", parts=[Part.from_text(text=text)]))])
+
+
+def run_concurrently(flight, key, func, callers):
+    """Starts func under key, then `callers` more calls once it is in flight; returns every result or error."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return func()
+
+    def call(f):
+        try:
+            return flight.do(key, f)
+        except BaseException as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=callers + 1) as executor:
+        futures = [executor.submit(call, leader)]
+        started.wait(5)
+        futures += [executor.submit(call, lambda: "not coalesced") for _ in range(callers)]
+        # the waiters have joined the call in flight
+        while flight.stats()["coalesced"] < callers:
+            time.sleep(0.01)
+        release.set()
+        return [future.result(5) for future in futures]
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+
+    results = run_concurrently(flight, "key", lambda: "answer", callers=3)
+
+    assert results == ["answer"] * 4
+    assert flight.stats() == {"calls": 1, "coalesced": 3}
+    assert flight.in_flight == {}
+
+
+def test_single_flight_shares_the_error():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("model failed")
+
+    results = run_concurrently(flight, "key", fail, callers=2)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    # the next call is made again rather than reusing the failure
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_single_flight_releases_waiters_on_base_exception():
+    flight = SingleFlight()
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    results = run_concurrently(flight, "key", interrupt, callers=2)
+
+    assert isinstance(results[0], KeyboardInterrupt)
+    assert all(isinstance(result, CancelledError) for result in results[1:])
+    assert flight.in_flight == {}
+
+
+def test_cache_key_depends_on_model_and_contents():
+    assert cache_key("model", "prompt") == cache_key("model", "prompt")
+    assert cache_key("model", "prompt") != cache_key("other", "prompt")
+    assert cache_key("model", "prompt") != cache_key("model", "prompt", {"tools": []})
+
+
+def test_response_cache_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+
+    assert cache.get("key") is None
+    cache.put("key", response("hello"))
+
+    assert cache.get("key").text == "hello"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_response_cache_never_stores_empty_responses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+
+    cache.put("key", GenerateContentResponse(candidates=[]))
+
+    assert cache.get("key") is None
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_entries=2)
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+
+    cache.put("a", response("a"))
+    cache.put("b", response("b"))
+    # using "a" makes "b" the least recently used
+    assert cache.get("a") is not None
+    cache.put("c", response("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a").text == "a"
+    assert cache.get("c").text == "c"
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.parametrize("max_entries", [1, 3])
+def test_response_cache_is_bounded(tmp_path, max_entries):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_entries=max_entries)
+
+    for i in range(5):
+        cache.put(str(i), response(str(i)))
+
+    assert cache.stats()["entries"] == max_entries
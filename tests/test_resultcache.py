@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from resultcache import ToolResultCache, is_read_only
+
+TOOLS = [
+    {"name": "get-events", "cache_ttl": 60, "returns": {"type": "array", "items": "calendar_event"}},
+    {"name": "list-calendars", "cache_ttl": 600, "returns": {"type": "array", "items": "calendar"}},
+    {"name": "get-current-date"},
+    {"name": "update-event", "returns": "calendar_event"},
+    {"name": "create-calendar", "invalidates": ["list-calendars"]},
+]
+
+OK = {"result": {"content": [{"type": "text", "text": "[]"}]}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+def test_only_tools_with_a_ttl_are_cached():
+    cache = ToolResultCache(TOOLS)
+
+    cache.put("get-current-date", {}, OK)
+
+    assert cache.cacheable("get-events")
+    assert not cache.cacheable("get-current-date")
+    assert cache.get("get-current-date", {}) is None
+
+
+def test_results_are_keyed_by_canonical_arguments(clock):
+    cache = ToolResultCache(TOOLS)
+
+    cache.put("get-events", {"calendarId": "primary", "maxResults": 5}, OK)
+
+    assert cache.get("get-events", {"maxResults": 5, "calendarId": "primary"}) == OK
+    assert cache.get("get-events", {"calendarId": "work", "maxResults": 5}) is None
+
+
+def test_results_expire_after_their_ttl(clock):
+    cache = ToolResultCache(TOOLS)
+    cache.put("get-events", {}, OK)
+
+    clock.now += 59
+    assert cache.get("get-events", {}) == OK
+    clock.now += 2
+    assert cache.get("get-events", {}) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_write_invalidates_tools_returning_the_same_data_type(clock):
+    cache = ToolResultCache(TOOLS)
+    cache.put("get-events", {}, OK)
+    cache.put("list-calendars", {}, OK)
+
+    cache.called("update-event")
+
+    assert cache.get("get-events", {}) is None
+    assert cache.get("list-calendars", {}) == OK
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_write_invalidates_its_listed_tools(clock):
+    cache = ToolResultCache(TOOLS)
+    cache.put("get-events", {}, OK)
+    cache.put("list-calendars", {}, OK)
+
+    cache.called("create-calendar")
+
+    assert cache.get("list-calendars", {}) is None
+    assert cache.get("get-events", {}) == OK
+
+
+def test_reads_invalidate_nothing(clock):
+    cache = ToolResultCache(TOOLS)
+    cache.put("get-events", {}, OK)
+
+    cache.called("list-calendars")
+    cache.called("get-current-date")
+
+    assert cache.get("get-events", {}) == OK
+
+
+@pytest.mark.parametrize("response, payload", [
+    ({"result": {"isError": True, "content": []}}, None),
+    ({"error": {"code": -32603, "message": "failed"}}, None),
+    (OK, {"error": "Calendar not found"}),
+    (OK, {"success": False, "message": "quota"}),
+])
+def test_failures_are_never_cached(clock, response, payload):
+    cache = ToolResultCache(TOOLS)
+
+    cache.put("get-events", {}, response, payload)
+
+    assert cache.get("get-events", {}) is None
+
+
+def test_least_recently_used_results_are_evicted(clock):
+    cache = ToolResultCache(TOOLS, max_entries=2)
+    cache.put("get-events", {"page": 1}, OK)
+    cache.put("get-events", {"page": 2}, OK)
+    cache.get("get-events", {"page": 1})
+
+    cache.put("get-events", {"page": 3}, OK)
+
+    assert cache.get("get-events", {"page": 2}) is None
+    assert cache.get("get-events", {"page": 1}) == OK
+    assert cache.stats()["evictions"] == 1
+
+
+def test_read_only_by_name_unless_the_manifest_says_otherwise():
+    assert is_read_only({"name": "get-events"})
+    assert is_read_only({"name": "search_emails"})
+    assert not is_read_only({"name": "send-email"})
+    assert not is_read_only({"name": "get-and-mark-read", "read_only": False})
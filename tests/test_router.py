@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from router import QueryRouter, tokenize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_examples():
+    with open(os.path.join(ROOT, "router-eval.jsonl"), "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def router():
+    with open(os.path.join(ROOT, "aegis-manifest.json"), "r") as f:
+        manifest = json.load(f)
+    return QueryRouter(manifest["servers"], manifest.get("routing_threshold", 0.25))
+
+
+def test_tokenize_drops_stopwords_and_single_letters_and_stems_plurals():
+    assert tokenize("Do I have any emails about tomorrow's meetings?") == ["email", "tomorrow", "meeting"]
+    assert tokenize("Address the class") == ["address", "class"]
+
+
+@pytest.mark.parametrize("example", load_examples(), ids=lambda example: example["query"])
+def test_queries_routed_locally_go_to_the_labeled_services(router, example):
+    expected = example["service"] if isinstance(example["service"], list) else [example["service"]]
+
+    services, confidence = router.route_many(example["query"])
+
+    # a query the router is not confident about goes to the LLM, which is not under test here
+    if services is not None:
+        assert set(services) == set(expected)
+        assert 0 < confidence <= 1
+
+
+def test_most_queries_are_routed_locally(router):
+    examples = load_examples()
+
+    local = [example for example in examples if router.route_many(example["query"])[0] is not None]
+
+    assert len(local) / len(examples) >= 0.8
+
+
+def test_time_words_do_not_pull_in_the_calendar(router):
+    assert router.route_many("Show me the emails I got today")[0] == ["google-gmail"]
+    assert router.scores("Show me the emails I got today")[0][0] == "google-gmail"
+
+
+def test_reads_using_both_services_fan_out(router):
+    services, confidence = router.route_many("Do I have any emails about tomorrow's meetings?")
+
+    assert sorted(services) == ["google-calendar", "google-gmail"]
+    assert confidence < 1
+
+
+def test_writes_using_both_services_are_left_to_the_llm(router):
+    query = "Check my inbox for a flight confirmation and add the flight to my calendar"
+
+    assert router.is_write(query)
+    assert router.route_many(query)[0] is None
+
+
+def test_write_tool_names_count_as_write_verbs():
+    router = QueryRouter({"mail": {"tools": [{"name": "trash-email"}, {"name": "get-unread-emails"}]}})
+
+    assert router.is_write("Trash the newsletter")
+    assert not router.is_write("What is unread?")
+
+
+def test_no_match_is_not_routed():
+    router = QueryRouter({"a": {"routing_keywords": ["alpha"]}, "b": {"routing_keywords": ["beta"]}})
+
+    assert router.route("gamma delta") == (None, 0.0)
+    assert router.route("alpha")[0] == "a"